@@ -27,6 +27,79 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+# Startup attempts of a serving worker before it exits, and the first delay
+# between them in seconds (doubled after each failure)
+app.config["STARTUP_ATTEMPTS"] = int(os.environ.get("STARTUP_ATTEMPTS", 5))
+app.config["STARTUP_RETRY_DELAY"] = float(os.environ.get("STARTUP_RETRY_DELAY", 1))
+
+# Blockchain sealing: votes are queued and mined into blocks in the background
+app.config["BLOCKCHAIN_BLOCK_SIZE"] = int(os.environ.get("BLOCKCHAIN_BLOCK_SIZE", 2))
+app.config["BLOCKCHAIN_SEAL_MAX_WAIT"] = float(os.environ.get("BLOCKCHAIN_SEAL_MAX_WAIT", 5))
+# Number of leading zero hex digits a proof of work must produce
+app.config["BLOCKCHAIN_DIFFICULTY"] = int(os.environ.get("BLOCKCHAIN_DIFFICULTY", 4))
+# Processes used for nonce search; 1 mines in the sealer thread, 0 uses every core
+app.config["BLOCKCHAIN_MINING_WORKERS"] = int(os.environ.get("BLOCKCHAIN_MINING_WORKERS", 1))
+# Blocks kept in the in-memory LRU and rows fetched per page when reading bodies
+app.config["BLOCKCHAIN_CACHE_SIZE"] = int(os.environ.get("BLOCKCHAIN_CACHE_SIZE", 256))
+app.config["BLOCKCHAIN_PAGE_SIZE"] = int(os.environ.get("BLOCKCHAIN_PAGE_SIZE", 100))
+# Seconds readers may serve the cached chain before checking the database tip
+app.config["BLOCKCHAIN_TIP_REFRESH"] = float(os.environ.get("BLOCKCHAIN_TIP_REFRESH", 1))
+# Directory of the memory-mapped log of sealed blocks (empty disables it)
+app.config["CHAIN_LOG_DIR"] = os.environ.get("CHAIN_LOG_DIR", "")
+app.config["CHAIN_LOG_SEGMENT_BYTES"] = int(os.environ.get("CHAIN_LOG_SEGMENT_BYTES", 64 * 1024 * 1024))
+# Set to 0 when sealing runs as a separate `flask run-sealer` process
+app.config["BLOCKCHAIN_SEALER_IN_PROCESS"] = os.environ.get("BLOCKCHAIN_SEALER_IN_PROCESS", "1") == "1"
+# Seconds an elected sealer's lease lasts without renewal; only the holder
+# mines, and another worker's sealer takes over once it lapses
+app.config["BLOCKCHAIN_SEALER_LEASE"] = float(os.environ.get("BLOCKCHAIN_SEALER_LEASE", 30))
+
+# Group commit: votes arriving within VOTE_COMMIT_MAX_WAIT seconds share one
+# transaction, up to VOTE_COMMIT_MAX_BATCH votes
+app.config["VOTE_COMMIT_MAX_BATCH"] = int(os.environ.get("VOTE_COMMIT_MAX_BATCH", 64))
+app.config["VOTE_COMMIT_MAX_WAIT"] = float(os.environ.get("VOTE_COMMIT_MAX_WAIT", 0.005))
+
+# Seconds a worker may serve cached election tallies before re-reading them
+app.config["RESULTS_CACHE_TTL"] = float(os.environ.get("RESULTS_CACHE_TTL", 5))
+# Seconds a worker may reuse a logged-in user's identity without querying the DB
+app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 30))
+# Seconds a worker may go without checking whether another worker changed a
+# user; bounds how long a deleted or demoted user keeps a cached identity
+app.config["USER_CACHE_CHECK_INTERVAL"] = float(os.environ.get("USER_CACHE_CHECK_INTERVAL", 1))
+
+# Live updates: seconds between checks for changes made by other workers,
+# the lifetime of one event stream and the events buffered per viewer
+app.config["EVENTS_POLL_INTERVAL"] = float(os.environ.get("EVENTS_POLL_INTERVAL", 1))
+app.config["EVENTS_STREAM_TIMEOUT"] = float(os.environ.get("EVENTS_STREAM_TIMEOUT", 300))
+app.config["EVENTS_QUEUE_SIZE"] = int(os.environ.get("EVENTS_QUEUE_SIZE", 100))
+# Seconds between background refreshes of the admin dashboard statistics
+app.config["DASHBOARD_REFRESH_INTERVAL"] = float(os.environ.get("DASHBOARD_REFRESH_INTERVAL", 10))
+# Rows per page of the admin voter, candidate and election listings
+app.config["ADMIN_PAGE_SIZE"] = int(os.environ.get("ADMIN_PAGE_SIZE", 50))
+
+# Cosine similarity at which a new scan counts as an already-enrolled retina.
+# Above 1 disables the check, which is the default: the current features do
+# not separate different people's scans well enough to reject on them
+app.config["RETINA_DUPLICATE_THRESHOLD"] = float(os.environ.get("RETINA_DUPLICATE_THRESHOLD", 2))
+# Seconds a worker's retina index may go without catching up with enrollments
+# made by other workers before a duplicate check
+app.config["RETINA_INDEX_SYNC_INTERVAL"] = float(os.environ.get("RETINA_INDEX_SYNC_INTERVAL", 0))
+# Directory of the content-addressed store for raw retina scans
+app.config["RETINA_BLOB_DIR"] = os.environ.get("RETINA_BLOB_DIR", os.path.join(app.instance_path, "retina_blobs"))
+# Largest retina scan accepted by the binary upload endpoints
+app.config["RETINA_UPLOAD_MAX_BYTES"] = int(os.environ.get("RETINA_UPLOAD_MAX_BYTES", 5 * 1024 * 1024))
+# Side length the browser downscales captured frames to (0 uploads full frames)
+app.config["RETINA_CAPTURE_SIZE"] = int(os.environ.get("RETINA_CAPTURE_SIZE", 224))
+
+# Retina scans processed at once; requests wait for their scan's result
+app.config["RETINA_SCAN_WORKERS"] = int(os.environ.get("RETINA_SCAN_WORKERS", 2))
+# Scans allowed to wait for a worker before new ones get a 503
+app.config["RETINA_SCAN_QUEUE_DEPTH"] = int(os.environ.get("RETINA_SCAN_QUEUE_DEPTH", 16))
+# Seconds a request waits for its scan before giving up with a 503
+app.config["RETINA_SCAN_TIMEOUT"] = float(os.environ.get("RETINA_SCAN_TIMEOUT", 10))
+# Retry-After seconds sent with those 503 responses
+app.config["RETINA_SCAN_RETRY_AFTER"] = int(os.environ.get("RETINA_SCAN_RETRY_AFTER", 2))
+
 # initialize the app with the extension, flask-sqlalchemy >= 3.0.x
 db.init_app(app)
 
@@ -37,11 +110,38 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    # Cached principal instead of the full User row; see identity.py
+    from identity import load_principal
+    return load_principal(int(user_id))
 
 with app.app_context():
     # Make sure to import the models here or their tables won't be created
     import models  # noqa: F401
 
-    db.create_all()
+    # Create missing tables, then add the columns and indexes introduced
+    # after an existing database was created
+    from schema import create_tables, upgrade_schema
+    create_tables()
+    upgrade_schema()
+
+def create_app(warm_up=True):
+    """
+    Application factory used by main.py
+    
+    Registers the views and CLI commands and, unless `warm_up` is False,
+    runs the startup phase so the worker is warm before it accepts traffic.
+    Background workers are only started in a process that serves requests,
+    not when the app is loaded for a CLI command. A serving process that
+    cannot start after STARTUP_ATTEMPTS tries raises instead of serving.
+    """
+    import routes  # noqa: F401
+    from startup import bootstrap_with_retries, serving_process
+    
+    if warm_up:
+        serving = serving_process()
+        ready = bootstrap_with_retries(app, start_workers=serving,
+                                       attempts=app.config['STARTUP_ATTEMPTS'] if serving else 1,
+                                       delay=app.config['STARTUP_RETRY_DELAY'])
+        if not ready and serving:
+            raise RuntimeError("Startup failed, see the log for details")
+    return app
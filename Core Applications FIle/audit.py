@@ -0,0 +1,307 @@
+"""
+Offline audit of the persisted chain
+
+Blocks are streamed from the Block table in keyset batches, or read by the
+workers straight from the memory-mapped chain log. Each batch is verified in
+a worker process (block hashes, Merkle roots, links and proofs of
+work inside the batch, each at the difficulty its block records). The links between batches and every Vote row are
+checked in this process as results come back, in chain order.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chain_log import ChainLog
+from merkle import merkle_root
+from mining import LEGACY_DIFFICULTY, block_timestamp, hash_block, valid_proof
+
+# Errors listed in the report; the total is always counted
+MAX_REPORTED_ERRORS = 100
+
+# Keys of a block as it was hashed before Merkle roots
+LEGACY_KEYS = ('index', 'timestamp', 'data', 'previous_hash', 'nonce', 'hash')
+
+def _row_to_block(row):
+    index, timestamp, previous_hash, block_hash, nonce, root, difficulty, data = row
+    block = {
+        'index': index,
+        'timestamp': timestamp,
+        'previous_hash': previous_hash,
+        'hash': block_hash,
+        'nonce': nonce,
+        'data': json.loads(data)
+    }
+    if root is not None:
+        block['merkle_root'] = root
+    if difficulty is not None:
+        block['difficulty'] = difficulty
+    return block
+
+def _header(block):
+    """
+    Tuple of (index, hash, nonce, previous_hash, legacy_hash, difficulty) for _check_link
+
+    legacy_hash is only set for blocks sealed before Merkle roots: it is the
+    hash of the whole block including its 'hash' key, which is what the
+    proof of work of the following block was mined over at the time.
+    """
+    legacy_hash = None
+    if 'merkle_root' not in block:
+        legacy = {key: block[key] for key in LEGACY_KEYS if key in block}
+        legacy_hash = hashlib.sha256(json.dumps(legacy, sort_keys=True).encode()).hexdigest()
+    return (block['index'], block['hash'], block['nonce'], block['previous_hash'], legacy_hash,
+            block.get('difficulty', LEGACY_DIFFICULTY))
+
+def _check_link(previous, block):
+    """
+    Check the link from `previous` to `block`, both headers from _header
+
+    The proof is checked at the difficulty `block` was mined at.
+
+    A proof that fails against the previous block's hash is retried against
+    its legacy hash. A block sealed before Merkle roots whose proof fails
+    both ways is counted as unverifiable rather than as an error: its
+    previous block was hashed with a timestamp more precise than the
+    DateTime column keeps, so the preimage usually cannot be rebuilt.
+
+    Returns:
+        Tuple of (errors, number of unverifiable proofs)
+    """
+    errors = []
+    if block[0] != previous[0] + 1:
+        errors.append((block[0], 'index', f"follows block {previous[0]}"))
+    if block[3] != previous[1]:
+        errors.append((block[0], 'link', 'previous_hash does not match the preceding block'))
+    elif not valid_proof(previous[2], block[2], previous[1], block[5]) and not (
+            previous[4] is not None and valid_proof(previous[2], block[2], previous[4], block[5])):
+        if block[4] is not None:
+            return errors, 1
+        errors.append((block[0], 'proof', 'nonce does not satisfy the difficulty'))
+    return errors, 0
+
+def verify_chunk(rows):
+    """
+    Verify a batch of consecutive Block rows (runs in a worker process)
+
+    Args:
+        rows: Tuples of (id, timestamp, previous_hash, hash, nonce, merkle_root, difficulty, data)
+
+    Returns:
+        Dict with the first and last block headers, the block hashes, the
+        errors found and the (block hash, user_id, election_id, candidate_id)
+        key of every vote
+    """
+    loaded = []
+    for row in rows:
+        try:
+            loaded.append((row[0], _row_to_block(row), None))
+        except ValueError as e:
+            loaded.append((row[0], None, str(e)))
+    return _verify_blocks(loaded)
+
+def verify_log_range(directory, start, stop):
+    """Like verify_chunk, for the chain log records at positions [start, stop)"""
+    log = ChainLog(directory)
+    loaded = []
+    for position, index in enumerate(log.indices(start, stop), start):
+        data = log.read_at(position)
+        try:
+            if data is None:
+                raise ValueError('record is incomplete')
+            loaded.append((index, json.loads(bytes(data)), None))
+        except ValueError as e:
+            loaded.append((index, None, str(e)))
+    return _verify_blocks(loaded)
+
+def _verify_blocks(loaded):
+    errors = []
+    votes = []
+    hashes = []
+    unverifiable = 0
+    unverifiable_proofs = 0
+    previous = None
+    for index, block, problem in loaded:
+        if block is None:
+            errors.append((index, 'data', f"unreadable block data: {problem}"))
+            continue
+
+        hashes.append(block['hash'])
+        if hash_block(block) != block['hash']:
+            if 'merkle_root' in block:
+                errors.append((block['index'], 'hash', 'stored hash does not match the block header'))
+            else:
+                # Blocks sealed before Merkle roots were hashed over a timestamp
+                # with more precision than the DateTime column keeps
+                unverifiable += 1
+        if 'merkle_root' in block and merkle_root(block['data']) != block['merkle_root']:
+            errors.append((block['index'], 'merkle', 'Merkle root does not match the votes'))
+
+        header = _header(block)
+        if previous is not None:
+            link_errors, link_unverifiable = _check_link(previous, header)
+            errors.extend(link_errors)
+            unverifiable_proofs += link_unverifiable
+        previous = header
+
+        for vote in block['data']:
+            if isinstance(vote, dict):
+                votes.append((block['hash'], vote.get('user_id'), vote.get('election_id'),
+                              vote.get('candidate_id')))
+
+    index, first, _ = loaded[0]
+    return {
+        'first': _header(first) if first else (index, None, None, None, None, LEGACY_DIFFICULTY),
+        'last': previous,
+        'blocks': len(loaded),
+        'hashes': hashes,
+        'unverifiable': unverifiable,
+        'unverifiable_proofs': unverifiable_proofs,
+        'errors': errors,
+        'votes': votes
+    }
+
+class ChainAuditor:
+    """
+    Audits the Block table and cross-checks it against the Vote table
+
+    Must be run inside an app context. With `log_dir`, workers read blocks
+    from the chain log there instead of the Block table.
+    """
+
+    def __init__(self, workers=None, chunk_size=500, log_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.log_dir = log_dir
+
+    def run(self):
+        """
+        Run the audit
+
+        Returns:
+            Report dict: 'ok', counts, errors and per-phase timings in seconds
+        """
+        from app import db
+        from models import Block, PendingVote, Vote
+
+        timings = Counter()
+        started = time.perf_counter()
+        report = {'blocks': 0, 'unverifiable_legacy_hashes': 0, 'unverifiable_legacy_proofs': 0,
+                  'chain_votes': 0, 'vote_rows_checked': 0, 'errors_total': 0, 'errors': []}
+        previous = None
+        vote_mismatches = Counter()
+
+        def add_errors(errors):
+            report['errors_total'] += len(errors)
+            room = MAX_REPORTED_ERRORS - len(report['errors'])
+            report['errors'].extend({'block': index, 'check': check, 'detail': detail}
+                                    for index, check, detail in errors[:max(room, 0)])
+
+        def consume(result):
+            nonlocal previous
+            t = time.perf_counter()
+            # Chunk boundary: the first block must follow the previous chunk's last
+            if previous is None:
+                if result['first'][3] != '1':
+                    add_errors([(result['first'][0], 'link', 'first block is not a genesis block')])
+            else:
+                link_errors, link_unverifiable = _check_link(previous, result['first'])
+                add_errors(link_errors)
+                report['unverifiable_legacy_proofs'] += link_unverifiable
+            previous = result['last'] or previous
+            add_errors(result['errors'])
+            report['blocks'] += result['blocks']
+            report['unverifiable_legacy_hashes'] += result['unverifiable']
+            report['unverifiable_legacy_proofs'] += result['unverifiable_proofs']
+            report['chain_votes'] += len(result['votes'])
+            timings['boundaries'] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            self._cross_check(db, Vote, result['hashes'], result['votes'], vote_mismatches, report)
+            timings['vote_cross_check'] += time.perf_counter() - t
+
+        if self.log_dir:
+            log = ChainLog(self.log_dir)
+            log_count = len(log)
+            db_height = db.session.query(db.func.max(Block.id)).scalar() or 0
+            if log.height() != db_height:
+                add_errors([(0, 'log', f"chain log ends at block {log.height()} but the database at {db_height}")])
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = deque()
+            after = 0
+            while True:
+                if self.log_dir:
+                    # Workers map the log themselves; only positions are sent
+                    if after >= log_count:
+                        break
+                    stop = min(after + self.chunk_size, log_count)
+                    in_flight.append(pool.submit(verify_log_range, self.log_dir, after, stop))
+                    after = stop
+                else:
+                    t = time.perf_counter()
+                    rows = db.session.query(Block.id, Block.timestamp, Block.previous_hash, Block.hash,
+                                            Block.nonce, Block.merkle_root, Block.difficulty, Block.data) \
+                        .filter(Block.id > after).order_by(Block.id).limit(self.chunk_size).all()
+                    rows = [(row.id, block_timestamp(row.timestamp, legacy=row.merkle_root is None),
+                             row.previous_hash, row.hash, row.nonce, row.merkle_root, row.difficulty,
+                             row.data) for row in rows]
+                    timings['read'] += time.perf_counter() - t
+                    if not rows:
+                        break
+                    after = rows[-1][0]
+                    in_flight.append(pool.submit(verify_chunk, rows))
+
+                # Keep a bounded number of chunks in flight, consumed in chain order
+                while len(in_flight) > self.workers * 2:
+                    t = time.perf_counter()
+                    result = in_flight.popleft().result()
+                    timings['verify_wait'] += time.perf_counter() - t
+                    consume(result)
+            while in_flight:
+                t = time.perf_counter()
+                result = in_flight.popleft().result()
+                timings['verify_wait'] += time.perf_counter() - t
+                consume(result)
+
+        # Vote rows pointing at a block hash that is not in the chain
+        t = time.perf_counter()
+        dangling = db.session.query(db.func.count(Vote.id)) \
+            .outerjoin(Block, Block.hash == Vote.blockchain_hash) \
+            .filter(Vote.blockchain_hash.isnot(None), Block.id.is_(None)).scalar()
+        vote_mismatches['vote_rows_with_unknown_block'] += dangling
+        report['unsealed_vote_rows'] = db.session.query(db.func.count(Vote.id)) \
+            .filter(Vote.blockchain_hash.is_(None)).scalar()
+        report['pending_votes'] = PendingVote.query.filter_by(status='pending').count()
+        timings['vote_cross_check'] += time.perf_counter() - t
+
+        total = time.perf_counter() - started
+        report['vote_mismatches'] = dict(vote_mismatches)
+        # Chain votes without a Vote row are expected for deleted voters, so
+        # only Vote rows the chain does not back fail the audit
+        report['ok'] = report['errors_total'] == 0 and not vote_mismatches['vote_rows_missing_from_block'] \
+            and not vote_mismatches['vote_rows_with_unknown_block']
+        report['timings'] = {phase: round(seconds, 4) for phase, seconds in timings.items()}
+        report['timings']['total'] = round(total, 4)
+        report['blocks_per_second'] = round(report['blocks'] / total, 1) if total else None
+        report['workers'] = self.workers
+        report['source'] = 'log' if self.log_dir else 'database'
+        report['chunk_size'] = self.chunk_size
+        logging.info(f"Chain audit finished: {report['blocks']} blocks, "
+                     f"{report['errors_total']} errors in {total:.2f}s")
+        return report
+
+    @staticmethod
+    def _cross_check(db, Vote, hashes, chain_votes, mismatches, report):
+        """Compare the votes sealed in a chunk with the Vote rows claiming its blocks"""
+        rows = db.session.query(Vote.blockchain_hash, Vote.user_id, Vote.election_id, Vote.candidate_id) \
+            .filter(Vote.blockchain_hash.in_(hashes)).all()
+        report['vote_rows_checked'] += len(rows)
+
+        expected = Counter(chain_votes)
+        recorded = Counter(tuple(row) for row in rows)
+        mismatches['vote_rows_missing_from_block'] += sum((recorded - expected).values())
+        mismatches['chain_votes_without_vote_row'] += sum((expected - recorded).values())
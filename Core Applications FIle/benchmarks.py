@@ -0,0 +1,239 @@
+"""
+Micro-benchmarks for the hot paths of the voting system
+
+Usage:
+    python benchmarks.py mining --difficulty 5 --workers 1,2,4
+    python benchmarks.py features --count 500 --workers 4
+    python benchmarks.py decode --count 200 --width 1280 --height 720 --smooth
+    python benchmarks.py votes --voters 2000 --threads 32 --batch 1,8,64
+"""
+import argparse
+import hashlib
+import os
+import time
+
+from mining import ParallelMiner
+
+def synthetic_scans(count, width=640, height=480, seed=0, smooth=False):
+    """
+    Generate JPEG-encoded webcam-sized frames with some vessel-like structure
+
+    The background is per-pixel noise, or with `smooth` noise upscaled 16x,
+    which is closer to a camera frame than noise at full resolution.
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    scans = []
+    for _ in range(count):
+        if smooth:
+            img = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_CUBIC)
+        else:
+            img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for _ in range(8):
+            start = tuple(int(v) for v in rng.integers(0, [width, height]))
+            end = tuple(int(v) for v in rng.integers(0, [width, height]))
+            cv2.line(img, start, end, (0, 0, 255), 3)
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        scans.append(buf.tobytes())
+    return scans
+
+def bench_mining(args):
+    """Report proof-of-work hashes/sec for each worker count"""
+    worker_counts = [int(w) for w in args.workers.split(',')]
+    print(f"difficulty={args.difficulty} rounds={args.rounds}")
+    print(f"{'workers':>8} {'hashes':>12} {'seconds':>9} {'hashes/sec':>12} {'per core':>12}")
+
+    for workers in worker_counts:
+        miner = ParallelMiner(workers=workers, difficulty=args.difficulty)
+        try:
+            # Warm the pool so process start-up is not measured
+            miner.search(0, '0' * 64)
+
+            total_hashes = 0
+            start = time.perf_counter()
+            for i in range(args.rounds):
+                last_hash = hashlib.sha256(str(i).encode()).hexdigest()
+                _, hashes = miner.search_with_stats(100 + i, last_hash)
+                total_hashes += hashes
+            elapsed = time.perf_counter() - start
+        finally:
+            miner.shutdown()
+
+        rate = total_hashes / elapsed
+        print(f"{miner.workers:>8} {total_hashes:>12} {elapsed:>9.2f} {rate:>12.0f} {rate / miner.workers:>12.0f}")
+
+def bench_features(args):
+    """Compare per-image feature extraction with the batched engine"""
+    from retina_authentication import RetinalAuthentication
+
+    auth = RetinalAuthentication()
+    scans = synthetic_scans(args.count)
+    print(f"{args.count} scans of 640x480 JPEG")
+
+    start = time.perf_counter()
+    for scan in scans:
+        auth.extract_features(scan)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    auth.extract_features_batch(scans, max_workers=args.workers)
+    batch = time.perf_counter() - start
+
+    print(f"{'path':>10} {'seconds':>9} {'scans/sec':>10}")
+    print(f"{'per-image':>10} {single:>9.2f} {args.count / single:>10.1f}")
+    print(f"{'batch':>10} {batch:>9.2f} {args.count / batch:>10.1f}")
+
+def bench_decode(args):
+    """
+    Compare full-color decode + resize with reduced grayscale decode, per scan
+
+    Also reports how far the reduced decode moves the stored features: the
+    cosine similarity and L2 distance between the features of the two edge
+    maps of each scan, next to the same figures for two extractions of the
+    full decode (the floor set by the per-scan noise in features_from_image).
+    """
+    import cv2
+    import numpy as np
+    from retina_authentication import FRAME_SIZE, RetinalAuthentication, decode_flags_for
+    from retina_index import cosine_similarity
+
+    def full_decode(scan):
+        img = cv2.imdecode(np.frombuffer(scan, np.uint8), cv2.IMREAD_COLOR)
+        gray = cv2.cvtColor(cv2.resize(img, (FRAME_SIZE, FRAME_SIZE)), cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+        return edges, img.nbytes
+
+    def reduced_decode(scan):
+        data = np.frombuffer(scan, np.uint8)
+        gray = cv2.imdecode(data, decode_flags_for(data))
+        resized = cv2.resize(gray, (FRAME_SIZE, FRAME_SIZE))
+        edges = cv2.Canny(cv2.GaussianBlur(resized, (5, 5), 0), 50, 150)
+        return edges, gray.nbytes
+
+    scans = synthetic_scans(args.count, args.width, args.height, smooth=args.smooth)
+    print(f"{args.count} {'smooth' if args.smooth else 'noise'} scans of {args.width}x{args.height} JPEG")
+    print(f"{'path':>10} {'ms/scan':>9} {'decoded bytes':>14}")
+
+    for name, decode in (('full', full_decode), ('reduced', reduced_decode)):
+        decode(scans[0])
+        start = time.perf_counter()
+        for scan in scans:
+            _, decoded = decode(scan)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10} {elapsed * 1000 / args.count:>9.2f} {decoded:>14}")
+
+    auth = RetinalAuthentication()
+    pairs = {'full/full': [], 'full/reduced': []}
+    for scan in scans:
+        full_edges, _ = full_decode(scan)
+        reduced_edges, _ = reduced_decode(scan)
+        full = auth.features_from_image(full_edges)
+        pairs['full/full'].append((full, auth.features_from_image(full_edges)))
+        pairs['full/reduced'].append((full, auth.features_from_image(reduced_edges)))
+
+    print(f"{'features':>12} {'min cosine':>11} {'mean cosine':>12} {'mean L2':>9} {'max L2':>9}")
+    for name, vectors in pairs.items():
+        similarities = [cosine_similarity(a, b) for a, b in vectors]
+        distances = [float(np.linalg.norm(a - b)) for a, b in vectors]
+        print(f"{name:>12} {min(similarities):>11.4f} {np.mean(similarities):>12.4f} "
+              f"{np.mean(distances):>9.4f} {max(distances):>9.4f}")
+
+def bench_votes(args):
+    """Votes/sec through the group-commit writer for each batch size"""
+    import tempfile
+    import threading
+    from datetime import datetime
+
+    # Use a throwaway SQLite database unless DATABASE_URL points elsewhere
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'votes.db'))
+    from app import app, create_app, db
+    from models import Candidate, Election, User
+    from routes import blockchain
+    from vote_writer import VoteWriter
+
+    create_app(warm_up=False)
+    with app.app_context():
+        blockchain.initialize()
+        users = [User(username=f'bench-{i}-{time.time_ns()}', email=f'bench-{i}-{time.time_ns()}@example.com',
+                      password_hash='-', is_registered=True) for i in range(args.voters)]
+        candidates = [Candidate(name=f'Candidate {i}', position='Bench') for i in range(4)]
+        db.session.add_all(users + candidates)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        candidate_ids = [candidate.id for candidate in candidates]
+
+    print(f"{args.voters} voters, {args.threads} threads")
+    print(f"{'batch':>6} {'seconds':>9} {'votes/sec':>10}")
+
+    for max_batch in (int(b) for b in args.batch.split(',')):
+        with app.app_context():
+            election = Election(title=f'Bench {max_batch}', start_date=datetime.utcnow(),
+                                end_date=datetime.utcnow(), is_active=True)
+            db.session.add(election)
+            db.session.commit()
+            election_id = election.id
+
+        writer = VoteWriter(blockchain, max_batch=max_batch, max_wait=args.max_wait)
+        writer.start(app)
+        pending = iter(user_ids)
+        lock = threading.Lock()
+
+        def voter():
+            while True:
+                with lock:
+                    user_id = next(pending, None)
+                if user_id is None:
+                    return
+                writer.submit({'user_id': user_id, 'candidate_id': candidate_ids[user_id % 4],
+                               'election_id': election_id, 'timestamp': datetime.utcnow().isoformat()})
+
+        threads = [threading.Thread(target=voter) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        writer.stop()
+
+        print(f"{max_batch:>6} {elapsed:>9.2f} {args.voters / elapsed:>10.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    mining = subparsers.add_parser('mining', help='proof-of-work throughput')
+    mining.add_argument('--difficulty', type=int, default=4)
+    mining.add_argument('--workers', default=','.join(
+        str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    mining.add_argument('--rounds', type=int, default=5)
+    mining.set_defaults(func=bench_mining)
+
+    features = subparsers.add_parser('features', help='retina feature extraction throughput')
+    features.add_argument('--count', type=int, default=200)
+    features.add_argument('--workers', type=int, default=None)
+    features.set_defaults(func=bench_features)
+
+    decode = subparsers.add_parser('decode', help='per-scan decode latency')
+    decode.add_argument('--count', type=int, default=200)
+    decode.add_argument('--width', type=int, default=640)
+    decode.add_argument('--height', type=int, default=480)
+    decode.add_argument('--smooth', action='store_true', help='smooth backgrounds instead of pixel noise')
+    decode.set_defaults(func=bench_decode)
+
+    votes = subparsers.add_parser('votes', help='group-commit vote throughput')
+    votes.add_argument('--voters', type=int, default=2000)
+    votes.add_argument('--threads', type=int, default=32)
+    votes.add_argument('--batch', default='1,8,64')
+    votes.add_argument('--max-wait', type=float, default=0.005)
+    votes.set_defaults(func=bench_votes)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
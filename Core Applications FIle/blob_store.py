@@ -0,0 +1,68 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+class BlobStore:
+    """
+    Content-addressed blob storage on the local filesystem
+
+    Blobs are keyed by their SHA-256 hex digest and sharded into
+    two-level directories (ab/cd/abcd...). Writes go to a temporary file in
+    the target directory and are moved into place with an atomic rename, so
+    readers never see a partial blob.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    @staticmethod
+    def digest_of(data):
+        """Key a blob with this content is stored under"""
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data):
+        """
+        Store bytes and return their digest
+
+        Storing content that already exists is a no-op.
+        """
+        digest = self.digest_of(data)
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest):
+        """Return the stored bytes, or None if the blob does not exist"""
+        try:
+            with open(self.path_for(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path_for(digest))
+        except FileNotFoundError:
+            logging.debug(f"Blob {digest} already removed")
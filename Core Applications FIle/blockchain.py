@@ -1,15 +1,43 @@
-import hashlib
 import json
-from time import time
+import secrets
+import threading
+from time import monotonic, time
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 from app import db
-from models import Block
+from models import Block, ChainState, PendingVote, Vote
+from chain_log import ChainLog
+from chain_store import ChainStore
+from merkle import leaf_hash, merkle_proof, merkle_root
+from mining import DEFAULT_DIFFICULTY, ParallelMiner, block_datetime, hash_block, valid_proof
 import logging
 
 class Blockchain:
-    def __init__(self):
-        self.chain = []
-        self.current_votes = []
+    """
+    Proof-of-work chain of sealed votes
+    
+    The database is the source of truth: pending votes live in PendingVote
+    and the tip in the ChainState row, which is locked while a block is
+    appended (but not while it is mined). The in-memory ChainStore is a per-process cache of it, caught up
+    from the database tip before every seal and on refresh().
+    """
+    
+    def __init__(self, difficulty=DEFAULT_DIFFICULTY, mining_workers=1,
+                 cache_size=256, page_size=100, log_dir=None, log_segment_bytes=64 * 1024 * 1024):
+        self.difficulty = difficulty
+        self.miner = ParallelMiner(workers=mining_workers, difficulty=difficulty)
+        # Optional local copy of sealed blocks that reads are served from
+        self.log = ChainLog(log_dir, segment_bytes=log_segment_bytes) if log_dir else None
+        # Only headers and the tail live in memory; bodies are paged in on demand
+        self.chain = ChainStore(cache_size=cache_size, page_size=page_size, log=self.log)
         self.initialized = False
+        # Guards the in-memory chain against the background sealer
+        self.lock = threading.RLock()
+        # Length of the chain prefix already verified by is_valid_chain
+        self._validated_height = 0
+        self._refreshed_at = None
+        # Called with each block this process commits, e.g. to push live updates
+        self.listeners = []
         
     def initialize(self):
         """Initialize blockchain from the database (called after app context is available)"""
@@ -17,126 +45,379 @@ class Blockchain:
             return
             
         try:
-            # Check if blockchain exists in DB
-            blocks = Block.query.order_by(Block.id).all()
+            self._ensure_state()
             
-            if not blocks:
-                # Create the genesis block if blockchain doesn't exist
-                self.new_block(previous_hash="1", proof=100)
-            else:
-                # Load the blockchain from the database
-                for block in blocks:
-                    self.chain.append({
-                        'index': block.id,
-                        'timestamp': block.timestamp.timestamp() if hasattr(block.timestamp, 'timestamp') else block.timestamp,
-                        'previous_hash': block.previous_hash,
-                        'hash': block.hash,
-                        'nonce': block.nonce,
-                        'data': json.loads(block.data)
-                    })
+            with self.lock:
+                # Index the blockchain headers from the DB under the tip lock,
+                # so only one worker creates the genesis block
+                state = self._lock_tip()
+                self.chain.load()
+                
+                if not self.chain:
+                    # Create the genesis block if blockchain doesn't exist
+                    self._commit_block(self._build_block(proof=100, previous_hash="1"), state)
+                else:
+                    db.session.commit()
+                self._refreshed_at = monotonic()
+                self._sync_log()
             
             self.initialized = True
             logging.info(f"Blockchain initialized with {len(self.chain)} blocks")
                 
         except Exception as e:
             logging.error(f"Error initializing blockchain: {str(e)}")
+            db.session.rollback()
             # Initialize with empty chain if there's an error
-            self.chain = []
-            self.current_votes = []
+            self.chain.clear()
+            self._validated_height = 0
+
+    def _ensure_state(self):
+        """Create the ChainState row from the current DB tip if it is missing"""
+        if db.session.get(ChainState, 1) is not None:
+            return
+        tip = Block.query.with_entities(Block.id, Block.hash).order_by(Block.id.desc()).first()
+        try:
+            db.session.add(ChainState(id=1, height=tip.id if tip else 0, tip_hash=tip.hash if tip else None))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.session.rollback()
+
+    @staticmethod
+    def _lock_tip():
+        """
+        Lock the ChainState row until the current transaction ends
+        
+        Serializes sealing across workers and nodes. SQLite has no row locks,
+        but it allows a single writer and the explicit Block id makes a
+        racing seal fail on the primary key instead of forking the chain.
+        """
+        return ChainState.query.filter_by(id=1).with_for_update().populate_existing().one()
 
-    def new_block(self, proof, previous_hash=None):
+    def refresh(self, state=None, max_age=0):
+        """
+        Bring the in-memory chain up to the database tip
+        
+        Args:
+            state: ChainState row already read in this transaction
+            max_age: Skip the check if the last one is younger than this many seconds
+        """
+        if state is None and max_age and self._refreshed_at is not None \
+                and monotonic() - self._refreshed_at < max_age:
+            return
+        if state is None:
+            state = ChainState.query.with_entities(ChainState.height, ChainState.tip_hash) \
+                .filter_by(id=1).first()
+            if state is None:
+                return
+                
+        with self.lock:
+            if state.height > self.chain.height():
+                self.chain.catch_up()
+            tail = self.chain.tail
+            if self.chain.height() != state.height or (tail and tail['hash'] != state.tip_hash):
+                # The local cache diverged (e.g. the chain was rebuilt); reindex it
+                logging.warning(f"Chain cache at height {self.chain.height()} diverged from the "
+                                f"database tip at {state.height}; reloading")
+                self.chain.load()
+                self._validated_height = 0
+            self._sync_log()
+            self._refreshed_at = monotonic()
+
+    def _sync_log(self):
+        """Append newly indexed blocks to the chain log; failures only cost the log"""
+        if self.log is None:
+            return
+        try:
+            self.chain.sync_log()
+        except Exception as e:
+            logging.error(f"Error syncing chain log: {str(e)}")
+
+    def new_block(self, proof, previous_hash=None, votes=None):
         """
         Create a new Block in the Blockchain
         """
-        previous_hash = previous_hash or self.chain[-1]['hash'] if self.chain else "1"
+        with self.lock:
+            state = self._lock_tip()
+            self.refresh(state)
+            block = self._build_block(proof, previous_hash, votes)
+            try:
+                self._commit_block(block, state)
+            except Exception:
+                db.session.rollback()
+                raise
+            
+        return block
+
+    def _build_block(self, proof, previous_hash=None, votes=None):
+        """Assemble and hash the block following the local tail without persisting it"""
+        if previous_hash is None:
+            previous_hash = self.chain.tail['hash'] if self.chain else "1"
         
+        votes = [] if votes is None else votes
         block = {
-            'index': len(self.chain) + 1,
-            'timestamp': time(),
-            'data': self.current_votes,
+            'index': self.chain.height() + 1,
+            # Microsecond precision survives the DateTime column, so the
+            # header can be re-hashed from the stored row
+            'timestamp': round(time(), 6),
+            'data': votes,
+            'merkle_root': merkle_root(votes),
             'previous_hash': previous_hash,
-            'nonce': proof
+            'nonce': proof,
+            # Recorded so a later difficulty change leaves the block valid
+            'difficulty': self.difficulty
         }
         
         # Calculate hash of this block
-        block_string = json.dumps(block, sort_keys=True).encode()
-        block['hash'] = hashlib.sha256(block_string).hexdigest()
+        block['hash'] = self.hash(block)
         
-        # Reset the current list of votes
-        self.current_votes = []
+        return block
+
+    def _commit_block(self, block, state):
+        """
+        Save a block to the database, advance the tip and append it to the chain.
         
-        # Add block to chain
-        self.chain.append(block)
+        Anything else staged in the session is committed in the same
+        transaction, so callers can add related rows beforehand.
         
-        # Save to database
-        # Convert timestamp to datetime for PostgreSQL compatibility
-        from datetime import datetime
+        Args:
+            block: Block built by _build_block
+            state: ChainState row locked by _lock_tip in this transaction
+        """
+        # Convert timestamp to datetime for PostgreSQL compatibility, in UTC
+        # so the header re-hashes the same in any timezone. The block index
+        # is the primary key, so two workers can never persist different
+        # blocks at the same height
         new_block = Block(
-            timestamp=datetime.fromtimestamp(block['timestamp']),
+            id=block['index'],
+            timestamp=block_datetime(block['timestamp']),
             previous_hash=block['previous_hash'],
             hash=block['hash'],
             nonce=block['nonce'],
-            data=json.dumps(block['data'])
+            data=json.dumps(block['data']),
+            merkle_root=block.get('merkle_root'),
+            difficulty=block.get('difficulty')
         )
         db.session.add(new_block)
+        state.height = block['index']
+        state.tip_hash = block['hash']
         db.session.commit()
         
-        return block
+        # Add block to chain only once it is durable
+        self.chain.append(block)
+        self._sync_log()
+        for listener in self.listeners:
+            listener(block)
+
+    def block_bytes(self, index):
+        """
+        Canonical JSON encoding of the whole block at `index`, as served by the API
+        
+        This includes 'hash' and 'data', so it is not the hash preimage; see
+        mining.block_preimage for that.
+        """
+        return self.chain.encoded(index)
+
+    def block_digest(self, index):
+        """
+        Hash of the block at `index`, recomputed from its header when the
+        block was created or indexed
+        
+        Returns:
+            Hex digest, or None for a block sealed before Merkle roots, which
+            cannot be re-hashed from the database
+        """
+        position = self.chain.position_of(index)
+        if position is None:
+            raise KeyError(index)
+        return self.chain.header(position)[4]
 
     def new_vote(self, vote_data):
         """
-        Creates a new vote to go into the next mined Block
+        Queue a vote for the background sealer and return its receipt.
+        
+        The vote is staged in the current session as a PendingVote and the
+        caller commits it together with its own rows. Proof of work happens
+        later in seal_pending, off the request path.
+        """
+        receipt = secrets.token_hex(16)
+        pending = PendingVote(receipt=receipt, data=json.dumps(vote_data, sort_keys=True))
+        db.session.add(pending)
+        return receipt
+
+    def pending_stats(self):
+        """
+        Returns:
+            Tuple of (number of pending votes, creation time of the oldest one)
         """
-        self.current_votes.append(vote_data)
+        return db.session.query(
+            db.func.count(PendingVote.id),
+            db.func.min(PendingVote.created_at)
+        ).filter(PendingVote.status == 'pending').one()
+
+    def seal_pending(self, max_votes=2, attempts=3):
+        """
+        Mine one block from the oldest pending votes
+        
+        Proof of work runs without holding self.lock or the ChainState row
+        lock, so refresh() and other workers are not blocked while mining.
+        Both are taken afterwards only to check that the tip has not moved
+        and to append the block; if it moved, the seal starts over.
         
-        # If we have enough votes, mine a new block
-        if len(self.current_votes) >= 2:  # Arbitrary number, could be adjusted
-            last_block = self.last_block
+        Args:
+            max_votes: Maximum number of votes to include in the block
+            attempts: How many times to mine before giving up on a moving tip
+            
+        Returns:
+            The sealed block, or None if nothing was pending or every
+            attempt lost the race for the tip
+        """
+        for attempt in range(attempts):
+            with self.lock:
+                self.refresh()
+                pending = PendingVote.query.with_entities(PendingVote.id) \
+                    .filter_by(status='pending').order_by(PendingVote.id).limit(max_votes).all()
+                last_block = dict(self.last_block)
+                # End the read transaction before mining
+                db.session.rollback()
+            if not pending:
+                return None
+                
+            pending_ids = [p.id for p in pending]
             proof = self.proof_of_work(last_block)
-            self.new_block(proof)
             
-        # Return the index of the block that will hold this vote
-        return self.last_block['index'] + 1 if self.current_votes else self.last_block['index']
+            with self.lock:
+                state = self._lock_tip()
+                pending = PendingVote.query.filter(PendingVote.id.in_(pending_ids),
+                                                   PendingVote.status == 'pending') \
+                    .order_by(PendingVote.id).with_for_update().all()
+                if state.tip_hash != last_block['hash'] or len(pending) != len(pending_ids):
+                    # Another worker sealed a block (or these votes) meanwhile
+                    db.session.rollback()
+                    logging.info(f"Chain tip moved while mining on block {last_block['index']}; "
+                                 f"retrying ({attempt + 1}/{attempts})")
+                    continue
+                self.refresh(state)
+                
+                votes = [json.loads(p.data) for p in pending]
+                block = self._build_block(proof, votes=votes)
+                
+                # Stage the queue and Vote updates so they commit with the block
+                receipts = [p.receipt for p in pending]
+                sealed_at = datetime.utcnow()
+                for p in pending:
+                    p.status = 'sealed'
+                    p.block_index = block['index']
+                    p.block_hash = block['hash']
+                    p.sealed_at = sealed_at
+                Vote.query.filter(Vote.receipt.in_(receipts)).update(
+                    {Vote.blockchain_hash: block['hash']}, synchronize_session=False)
+                
+                try:
+                    self._commit_block(block, state)
+                except IntegrityError:
+                    # Another worker sealed this height first (SQLite has no row lock)
+                    db.session.rollback()
+                    logging.warning(f"Block {block['index']} was sealed by another worker; retrying")
+                    self.refresh()
+                    continue
+                except Exception:
+                    db.session.rollback()
+                    raise
+                    
+                logging.info(f"Sealed block {block['index']} with {len(votes)} votes")
+                return block
+                
+        logging.warning(f"Gave up sealing after {attempts} attempts; the chain tip kept moving")
+        return None
+
+    @staticmethod
+    def lookup_receipt(receipt):
+        """
+        Look up the sealing status of a vote receipt
+        
+        Returns:
+            Dict describing the receipt, or None if it is unknown
+        """
+        pending = PendingVote.query.filter_by(receipt=receipt).first()
+        if pending is None:
+            return None
+        return {
+            'receipt': pending.receipt,
+            'status': pending.status,
+            'submitted_at': pending.created_at.isoformat() if pending.created_at else None,
+            'sealed_at': pending.sealed_at.isoformat() if pending.sealed_at else None,
+            'block_index': pending.block_index,
+            'block_hash': pending.block_hash
+        }
+
+    def inclusion_proof(self, receipt):
+        """
+        Merkle inclusion proof for the vote behind a receipt
+        
+        Returns:
+            Dict with the vote, its leaf hash and position, the proof and the
+            block header it leads to; None if the receipt is unknown or not
+            sealed into a block with a Merkle root
+        """
+        pending = PendingVote.query.filter_by(receipt=receipt, status='sealed').first()
+        if pending is None:
+            return None
+        block = self.chain.get(pending.block_index)
+        if 'merkle_root' not in block:
+            return None
+            
+        vote = json.loads(pending.data)
+        leaf = leaf_hash(vote)
+        votes = block['data']
+        position = next((i for i, v in enumerate(votes) if leaf_hash(v) == leaf), None)
+        if position is None:
+            return None
+        return {
+            'receipt': receipt,
+            'vote': vote,
+            'leaf_hash': leaf.hex(),
+            'position': position,
+            'proof': merkle_proof(votes, position),
+            'block': {key: value for key, value in block.items() if key != 'data'}
+        }
 
     def proof_of_work(self, last_block):
         """
         Simple Proof of Work Algorithm:
-        - Find a number p' such that hash(pp') contains leading 4 zeroes, where p is the previous p'
+        - Find a number p' such that hash(pp') contains `difficulty` leading zeroes, where p is the previous p'
         - p is the previous proof, and p' is the new proof
+        - The nonce space is searched by self.miner, across a process pool if configured
+        - The previous block's stored hash is used as-is rather than re-serializing the block
         """
         last_proof = last_block['nonce']
-        last_hash = self.hash(last_block)
+        last_hash = last_block['hash']
         
-        proof = 0
-        while self.valid_proof(last_proof, proof, last_hash) is False:
-            proof += 1
-            
-        return proof
+        return self.miner.search(last_proof, last_hash)
     
     @staticmethod
-    def valid_proof(last_proof, proof, last_hash):
+    def valid_proof(last_proof, proof, last_hash, difficulty=DEFAULT_DIFFICULTY):
         """
-        Validates the Proof: Does hash(last_proof, proof, last_hash) contain 4 leading zeroes?
+        Validates the Proof: Does hash(last_proof, proof, last_hash) contain `difficulty` leading zeroes?
         """
-        guess = f'{last_proof}{proof}{last_hash}'.encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash[:4] == "0000"
+        return valid_proof(last_proof, proof, last_hash, difficulty)
 
     @staticmethod
     def hash(block):
         """
         Creates a SHA-256 hash of a Block
+        
+        Blocks with a Merkle root are hashed over their header alone, since
+        the root already commits to the votes; older blocks over everything.
         """
-        # We must make sure that the Dictionary is Ordered, or we'll have inconsistent hashes
-        block_string = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return hash_block(block)
 
     @property
     def last_block(self):
         """
         Returns the last Block in the chain
         """
-        return self.chain[-1] if self.chain else {
+        return self.chain.tail if self.chain else {
             'index': 0,
             'timestamp': time(),
             'data': [],
@@ -145,20 +426,46 @@ class Blockchain:
             'hash': "1"
         }
 
-    def is_valid_chain(self):
+    def is_valid_chain(self, full=False):
         """
         Determine if a given blockchain is valid
+        
+        Every block's stored hash must match the digest recomputed from its
+        header, link to the previous block's digest and carry a valid proof
+        of work at the difficulty it was mined at, and its votes must match
+        its Merkle root. Only blocks
+        appended since the last successful check are verified, unless `full`
+        is set.
+        
+        Blocks sealed before Merkle roots cannot be re-hashed from the
+        database, so their stored hash is trusted and their proofs, which
+        were mined over a hash of the whole block, are not checked.
         """
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i-1]
+        with self.lock:
+            start = 1 if full else max(1, self._validated_height)
             
-            # Check that the hash of the block is correct
-            if current_block['previous_hash'] != self.hash(previous_block):
-                return False
+            for i in range(start, len(self.chain)):
+                _, block_hash, previous_hash, nonce, digest, difficulty = self.chain.header(i)
+                _, last_hash, _, last_nonce, last_digest, _ = self.chain.header(i-1)
                 
-            # Check that the Proof of Work is correct
-            if not self.valid_proof(previous_block['nonce'], current_block['nonce'], previous_block['hash']):
-                return False
+                # Check that the header hashes to the stored hash
+                if digest is not None and digest != block_hash:
+                    return False
+                    
+                # Check that the block links to the previous block's hash
+                last_hash = last_digest or last_hash
+                if previous_hash != last_hash:
+                    return False
+                    
+                # Check that the Proof of Work is correct
+                if digest is not None and not self.valid_proof(last_nonce, nonce, last_hash, difficulty):
+                    return False
+                    
+            # Check the votes of the newly verified blocks against their roots
+            if start < len(self.chain):
+                after = 0 if full else self.chain.header(start)[0] - 1
+                if self.chain.verify_bodies(after) is not None:
+                    return False
                 
-        return True
+            self._validated_height = len(self.chain)
+            return True
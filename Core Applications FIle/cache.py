@@ -0,0 +1,53 @@
+import threading
+from time import monotonic
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache whose entries expire after `ttl` seconds
+    """
+
+    def __init__(self, ttl=5.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Drop expired entries first, then the oldest one
+                now = monotonic()
+                for stale in [k for k, (expires, _) in self._entries.items() if expires < now]:
+                    del self._entries[stale]
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (monotonic() + self.ttl, value)
+
+    def get_or_set(self, key, factory):
+        """Return the cached value for `key`, computing it with `factory()` on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_MISSING = object()
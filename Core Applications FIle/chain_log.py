@@ -0,0 +1,214 @@
+"""
+Append-only on-disk log of sealed blocks
+
+Blocks are stored as length-prefixed canonical JSON in segment files of at
+most `segment_bytes`, with a fixed-width index of (block index, segment,
+offset, length) records. Both are memory-mapped for reads, so a block can be
+served from local disk without a database round trip or a copy.
+
+The Block table stays the source of truth: the log only ever holds a prefix
+of it, is appended to after blocks are committed and is rebuilt from the
+database when its tip disagrees.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Block index, segment number, offset of the record, length of the block bytes
+INDEX_RECORD = struct.Struct('<QIQI')
+LENGTH_PREFIX = struct.Struct('<I')
+INDEX_NAME = 'chain.idx'
+LOCK_NAME = 'chain.lock'
+
+class ChainLog:
+    """Memory-mapped, append-only segment log of canonical block encodings"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, INDEX_NAME)
+        self._maps = {}
+        self._lock = threading.RLock()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'segment-{segment:06d}.log')
+
+    def _map(self, path, needed):
+        """
+        Read-only map of a file covering at least `needed` bytes, or None
+        
+        A cached map is only reused while the file at `path` is still the one
+        it maps (same device and inode) and has not shrunk: reset() in another
+        process deletes and recreates the files, and the old map would keep
+        serving the blocks that were there before.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._maps.pop(path, None)
+            return None
+        cached = self._maps.get(path)
+        if cached is not None:
+            current, identity = cached
+            if identity == (stat.st_dev, stat.st_ino) and needed <= len(current) <= stat.st_size:
+                return current
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_size < needed or stat.st_size == 0:
+                    return None
+                # Older maps stay alive while callers hold views into them
+                current = mmap.mmap(f.fileno(), stat.st_size, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        self._maps[path] = (current, (stat.st_dev, stat.st_ino))
+        return current
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self._index_path) // INDEX_RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def _record(self, position):
+        with self._lock:
+            index_map = self._map(self._index_path, (position + 1) * INDEX_RECORD.size)
+            if index_map is None:
+                return None
+            return INDEX_RECORD.unpack_from(index_map, position * INDEX_RECORD.size)
+
+    def height(self):
+        """Index of the last block in the log, or 0 for an empty log"""
+        count = len(self)
+        return self._record(count - 1)[0] if count else 0
+
+    def indices(self, start=0, stop=None):
+        """Block indices of the records at positions [start, stop)"""
+        stop = len(self) if stop is None else stop
+        return [self._record(position)[0] for position in range(start, stop)]
+
+    def position_of(self, index):
+        """Position of a block's index record, or None if it is not in the log"""
+        count = len(self)
+        if not count:
+            return None
+        # Indices are normally contiguous, so try the direct slot first
+        guess = index - self._record(0)[0]
+        if 0 <= guess < count and self._record(guess)[0] == index:
+            return guess
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < index:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count and self._record(low)[0] == index:
+            return low
+        return None
+
+    def read(self, index):
+        """
+        Canonical encoding of a block as a zero-copy memoryview
+
+        Returns:
+            memoryview of the block bytes, or None if the block is not in the log
+        """
+        position = self.position_of(index)
+        if position is None:
+            return None
+        return self.read_at(position)
+
+    def read_at(self, position):
+        """Block bytes of the record at `position`, or None if it is incomplete"""
+        record = self._record(position)
+        if record is None:
+            return None
+        _, segment, offset, length = record
+        with self._lock:
+            data = self._map(self._segment_path(segment), offset + LENGTH_PREFIX.size + length)
+        if data is None or LENGTH_PREFIX.unpack_from(data, offset)[0] != length:
+            return None
+        start = offset + LENGTH_PREFIX.size
+        return memoryview(data)[start:start + length]
+
+    def get(self, index):
+        """Decoded block dict, or None if the block is not in the log"""
+        data = self.read(index)
+        return json.loads(bytes(data)) if data is not None else None
+
+    def append(self, blocks):
+        """
+        Append encoded blocks after the current tail
+
+        Blocks at or below the log height are skipped, so processes sharing
+        the directory can append the same blocks without duplicating them.
+
+        Args:
+            blocks: Iterable of (block index, canonical bytes) in chain order
+
+        Returns:
+            Number of blocks written
+        """
+        with self._lock, open(os.path.join(self.directory, LOCK_NAME), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            height = self.height()
+            count = len(self)
+            segment, offset = 0, 0
+            if count:
+                _, segment, last_offset, last_length = self._record(count - 1)
+                offset = last_offset + LENGTH_PREFIX.size + last_length
+
+            written = 0
+            data_file = None
+            index_file = open(self._index_path, 'ab')
+            try:
+                for index, encoded in blocks:
+                    if index <= height:
+                        continue
+                    size = LENGTH_PREFIX.size + len(encoded)
+                    if offset and offset + size > self.segment_bytes:
+                        # Roll over to a new segment
+                        segment, offset = segment + 1, 0
+                        if data_file is not None:
+                            data_file.close()
+                            data_file = None
+                    if data_file is None:
+                        data_file = open(self._segment_path(segment), 'r+b' if offset else 'wb')
+                        data_file.seek(offset)
+                    # Data first, then its index record, so a crash never
+                    # leaves an index record pointing at missing bytes
+                    data_file.write(LENGTH_PREFIX.pack(len(encoded)))
+                    data_file.write(encoded)
+                    data_file.flush()
+                    index_file.write(INDEX_RECORD.pack(index, segment, offset, len(encoded)))
+                    index_file.flush()
+                    offset += size
+                    height = index
+                    written += 1
+            finally:
+                index_file.close()
+                if data_file is not None:
+                    data_file.close()
+            return written
+
+    def reset(self):
+        """Delete every segment and the index"""
+        with self._lock, open(os.path.join(self.directory, LOCK_NAME), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._maps = {}
+            for name in os.listdir(self.directory):
+                if name == INDEX_NAME or (name.startswith('segment-') and name.endswith('.log')):
+                    os.remove(os.path.join(self.directory, name))
+            logging.info(f"Chain log in {self.directory} reset")
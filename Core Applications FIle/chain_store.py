@@ -0,0 +1,333 @@
+import bisect
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from merkle import merkle_root
+from mining import LEGACY_DIFFICULTY, block_timestamp, hash_block
+from models import Block
+
+def block_to_dict(row):
+    """Convert a Block row into the chain's block dict format"""
+    block = {
+        'index': row.id,
+        'timestamp': block_timestamp(row.timestamp, legacy=row.merkle_root is None),
+        'previous_hash': row.previous_hash,
+        'hash': row.hash,
+        'nonce': row.nonce,
+        'data': json.loads(row.data)
+    }
+    # Blocks sealed before Merkle roots or recorded difficulties keep their original shape
+    if row.merkle_root is not None:
+        block['merkle_root'] = row.merkle_root
+    if row.difficulty is not None:
+        block['difficulty'] = row.difficulty
+    return block
+
+def header_digest(index, timestamp, previous_hash, nonce, root, difficulty=None):
+    """
+    Hash of a block computed from its header columns
+    
+    Returns:
+        Hex digest, or None for blocks sealed before Merkle roots, whose hash
+        covers the votes and a timestamp the database no longer holds exactly
+    """
+    if root is None:
+        return None
+    header = {'index': index, 'timestamp': block_timestamp(timestamp), 'previous_hash': previous_hash,
+              'nonce': nonce, 'merkle_root': root}
+    if difficulty is not None:
+        header['difficulty'] = difficulty
+    return hash_block(header)
+
+class ChainStore:
+    """
+    List-like view of the blockchain that keeps only headers in memory
+
+    The store holds a compact header index (index, hash, previous_hash, nonce,
+    digest, difficulty) for every block plus the tail block, where `digest` is
+    the hash recomputed from the header when it was indexed and `difficulty`
+    the one the block was mined at. Block bodies are read from the
+    Block table on demand in keyset-paginated batches and kept in a bounded
+    LRU, together with their canonical encoding. With a ChainLog attached,
+    misses are served from the memory-mapped log instead of the database.
+    """
+
+    def __init__(self, cache_size=256, page_size=100, log=None):
+        self.cache_size = cache_size
+        self.page_size = page_size
+        self.log = log
+        self._headers = []
+        self._indices = []
+        self._tail = None
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+
+    def load(self):
+        """Rebuild the header index from the database without reading block data"""
+        with self._lock:
+            self.clear()
+            self.catch_up()
+            logging.info(f"Chain store indexed {len(self._headers)} blocks")
+
+    def catch_up(self):
+        """
+        Index blocks written since the local tail, e.g. by another worker
+        
+        Returns:
+            Number of headers added
+        """
+        with self._lock:
+            after = self.height()
+            added = 0
+            while True:
+                rows = Block.query.with_entities(Block.id, Block.hash, Block.previous_hash, Block.nonce,
+                                                 Block.timestamp, Block.merkle_root, Block.difficulty) \
+                    .filter(Block.id > after).order_by(Block.id).limit(self.page_size * 10).all()
+                if not rows:
+                    break
+                for row in rows:
+                    digest = header_digest(row.id, row.timestamp, row.previous_hash, row.nonce,
+                                           row.merkle_root, row.difficulty)
+                    self._add_header(row.id, row.hash, row.previous_hash, row.nonce, digest,
+                                     row.difficulty or LEGACY_DIFFICULTY)
+                added += len(rows)
+                after = rows[-1].id
+
+            if added:
+                self._tail = self[-1]
+            return added
+
+    def clear(self):
+        with self._lock:
+            self._headers = []
+            self._indices = []
+            self._tail = None
+            self._cache.clear()
+
+    def _add_header(self, index, block_hash, previous_hash, nonce, digest, difficulty):
+        self._indices.append(index)
+        self._headers.append((index, block_hash, previous_hash, nonce, digest, difficulty))
+
+    def append(self, block):
+        """Append a newly persisted block; it becomes the tail"""
+        with self._lock:
+            digest = hash_block(block) if 'merkle_root' in block else None
+            self._add_header(block['index'], block['hash'], block['previous_hash'], block['nonce'], digest,
+                             block.get('difficulty', LEGACY_DIFFICULTY))
+            self._tail = block
+            self._remember(block)
+
+    def _remember(self, block, encoded=None):
+        if encoded is None:
+            encoded = json.dumps(block, sort_keys=True).encode()
+        self._cache[block['index']] = (block, encoded)
+        self._cache.move_to_end(block['index'])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def __len__(self):
+        return len(self._headers)
+
+    def __bool__(self):
+        return bool(self._headers)
+
+    @property
+    def tail(self):
+        return self._tail
+
+    def header(self, position):
+        """Return (index, hash, previous_hash, nonce, digest, difficulty) for the block at `position`"""
+        return self._headers[position]
+
+    def height(self):
+        """Index of the tail block, or 0 for an empty chain"""
+        return self._headers[-1][0] if self._headers else 0
+
+    def position_of(self, index):
+        """Position in the chain of the block with the given index, or None"""
+        position = bisect.bisect_left(self._indices, index)
+        if position < len(self._indices) and self._indices[position] == index:
+            return position
+        return None
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        index = self._headers[position][0]
+        return self.get(index)
+
+    def get(self, index):
+        """Fetch the block with the given index, reading a page from the DB on a miss"""
+        return self._entry(index)[0]
+
+    def encoded(self, index):
+        """Canonical JSON encoding of the block with the given index"""
+        return self._entry(index)[1]
+
+    def _entry(self, index):
+        with self._lock:
+            entry = self._cache.get(index)
+            if entry is not None:
+                self._cache.move_to_end(index)
+                return entry
+
+            data = self.log.read(index) if self.log is not None else None
+            if data is not None:
+                encoded = bytes(data)
+                self._remember(json.loads(encoded), encoded)
+                return self._cache[index]
+                
+            # Read ahead so sequential access costs one query per page
+            self.fetch(index - 1, min(self.page_size, self.cache_size))
+            entry = self._cache.get(index)
+            if entry is None:
+                raise KeyError(index)
+            return entry
+
+    def fetch(self, after, limit, remember=True):
+        """
+        Fetch up to `limit` blocks with an index greater than `after`
+
+        Args:
+            after: Keyset cursor; only blocks with a larger index are returned
+            limit: Maximum number of blocks to return
+            remember: Whether to keep the fetched blocks in the LRU
+
+        Returns:
+            List of block dicts in chain order
+        """
+        rows = Block.query.filter(Block.id > after).order_by(Block.id).limit(limit).all()
+        blocks = [block_to_dict(row) for row in rows]
+        if remember:
+            with self._lock:
+                for block in blocks:
+                    self._remember(block)
+        return blocks
+
+    def page(self, after, limit):
+        """
+        Return up to `limit` blocks after the `after` cursor
+
+        Served from the LRU when every block in the page is cached, which is
+        the common case for clients syncing the newest blocks.
+        """
+        with self._lock:
+            start = bisect.bisect_right(self._indices, after)
+            indices = self._indices[start:start + limit]
+            entries = [self._cache.get(index) for index in indices]
+            if all(entry is not None for entry in entries):
+                return [entry[0] for entry in entries]
+        if self._log_covers(indices):
+            return [self.get(index) for index in indices]
+        return self.fetch(after, limit)
+
+    def encoded_page(self, after, limit):
+        """
+        Like page(), but returns (index, canonical bytes) pairs
+        
+        Blocks missing from the LRU are served as zero-copy views into the
+        chain log when it covers them, without decoding or caching them.
+        """
+        with self._lock:
+            start = bisect.bisect_right(self._indices, after)
+            indices = self._indices[start:start + limit]
+            entries = [self._cache.get(index) for index in indices]
+        if all(entry is not None for entry in entries):
+            return [(index, entry[1]) for index, entry in zip(indices, entries)]
+        if self._log_covers(indices):
+            views = [(index, self.log.read(index)) for index in indices]
+            if all(view is not None for _, view in views):
+                return views
+        blocks = self.fetch(after, limit)
+        with self._lock:
+            return [(block['index'], self._cache[block['index']][1]) if block['index'] in self._cache
+                    else (block['index'], json.dumps(block, sort_keys=True).encode()) for block in blocks]
+
+    def _log_covers(self, indices):
+        return self.log is not None and bool(indices) and indices[-1] <= self.log.height()
+
+    def sync_log(self):
+        """
+        Bring the chain log up to date with the indexed headers
+        
+        The log is reset and rebuilt from the database if its tip is ahead of
+        the chain or its block at the shared height has a different hash.
+        
+        Returns:
+            Number of blocks appended
+        """
+        if self.log is None:
+            return 0
+        with self._lock:
+            log_height = self.log.height()
+            if log_height:
+                position = self.position_of(log_height)
+                logged = self.log.get(log_height)
+                if position is None or logged is None or logged.get('hash') != self._headers[position][1]:
+                    logging.warning(f"Chain log at height {log_height} does not match the database; rebuilding")
+                    self.log.reset()
+                    log_height = 0
+            if log_height >= self.height():
+                return 0
+                
+            appended = 0
+            after = log_height
+            while True:
+                blocks = self.fetch(after, self.page_size, remember=False)
+                if not blocks:
+                    break
+                appended += self.log.append((block['index'], json.dumps(block, sort_keys=True).encode())
+                                            for block in blocks)
+                after = blocks[-1]['index']
+            if appended:
+                logging.debug(f"Appended {appended} blocks to the chain log")
+            return appended
+
+    def verify_bodies(self, after=0):
+        """
+        Check the votes of every block after `after` against its Merkle root
+        
+        Bodies are streamed from the database without touching the LRU.
+        
+        Returns:
+            Index of the first block whose votes do not match, or None
+        """
+        while True:
+            blocks = self.fetch(after, self.page_size, remember=False)
+            if not blocks:
+                return None
+            for block in blocks:
+                if 'merkle_root' in block and merkle_root(block['data']) != block['merkle_root']:
+                    return block['index']
+            after = blocks[-1]['index']
+
+    def summaries(self, after, limit):
+        """Like page(), but without block data and without touching the LRU"""
+        rows = Block.query.with_entities(Block.id, Block.timestamp, Block.previous_hash, Block.hash,
+                                         Block.nonce, Block.merkle_root, Block.difficulty) \
+            .filter(Block.id > after).order_by(Block.id).limit(limit).all()
+        return [{
+            'index': row.id,
+            'timestamp': block_timestamp(row.timestamp, legacy=row.merkle_root is None),
+            'previous_hash': row.previous_hash,
+            'hash': row.hash,
+            'nonce': row.nonce,
+            'merkle_root': row.merkle_root,
+            'difficulty': row.difficulty or LEGACY_DIFFICULTY
+        } for row in rows]
+
+    def __iter__(self):
+        # Full scans stream through without flushing the LRU, from the log if complete
+        if self.log is not None and self._headers and self.log.height() >= self.height():
+            for index in self._indices:
+                yield self.log.get(index)
+            return
+        after = 0
+        while True:
+            blocks = self.fetch(after, self.page_size, remember=False)
+            if not blocks:
+                return
+            yield from blocks
+            after = blocks[-1]['index']
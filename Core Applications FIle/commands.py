@@ -0,0 +1,169 @@
+import json
+import logging
+from collections import Counter
+
+import click
+
+from app import app, db
+from audit import ChainAuditor
+from enrollment import BulkEnrollmentImporter, EnrollmentSource
+from models import Block, User
+from retina_authentication import is_legacy_feature_blob
+from routes import blob_store, blockchain, ensure_retina_index, retina_auth, retina_index, sealer
+from startup import bootstrap, readiness
+from tally import counts_from_blocks, counts_from_pending, counts_from_votes, rebuild_tallies
+
+@app.cli.command('init')
+def init_command():
+    """Load chain state, ensure the admin user exists and warm caches"""
+    # The app factory has normally warmed this process up already
+    if not readiness.ready and not bootstrap(app, start_workers=False):
+        raise click.ClickException("Startup failed, see the log for details")
+    click.echo(f"Ready: {readiness.details}")
+
+@app.cli.command('run-sealer')
+def run_sealer():
+    """Run the block sealer in the foreground as a dedicated worker"""
+    with app.app_context():
+        blockchain.initialize()
+    logging.info("Running block sealer (Ctrl+C to stop)")
+    # CLI processes start no workers at startup, so this is the only sealer loop
+    sealer.start(app)
+    try:
+        sealer.join()
+    except KeyboardInterrupt:
+        sealer.stop()
+
+@app.cli.command('seal-pending')
+def seal_pending():
+    """Seal every pending vote now, regardless of block size or age"""
+    blockchain.initialize()
+    sealed = 0
+    while sealer.run_once(force=True) is not None:
+        sealed += 1
+    click.echo(f"Sealed {sealed} block(s)")
+
+@app.cli.command('rebuild-tallies')
+@click.option('--source', type=click.Choice(['votes', 'blockchain']), default='votes',
+              help='Recount from Vote rows or from sealed block data')
+@click.option('--election-id', type=int, default=None, help='Only rebuild this election')
+def rebuild_tallies_command(source, election_id):
+    """Rebuild the materialized VoteTally table"""
+    if source == 'votes':
+        counts = counts_from_votes(election_id)
+    else:
+        # Pending votes are not in any block yet, so seal them first
+        blockchain.initialize()
+        sealed = 0
+        while sealer.run_once(force=True) is not None:
+            sealed += 1
+        click.echo(f"Sealed {sealed} block(s) of pending votes")
+        counts = Counter(counts_from_blocks(Block.query.yield_per(500), election_id))
+        # Votes queued while sealing still count
+        counts.update(counts_from_pending(election_id))
+    rebuild_tallies(counts, election_id)
+    click.echo(f"Rebuilt {len(counts)} tally row(s) from {source}")
+
+@app.cli.command('audit-chain')
+@click.option('--workers', type=int, default=None, help='Verification processes (default: all cores)')
+@click.option('--chunk-size', type=int, default=500, help='Blocks verified per task')
+@click.option('--output', type=click.Path(), default=None, help='Write the JSON report here instead of stdout')
+@click.option('--from-log', is_flag=True, help='Read blocks from the chain log (CHAIN_LOG_DIR) instead of the database')
+def audit_chain(workers, chunk_size, output, from_log):
+    """Verify every persisted block and cross-check the Vote table against it"""
+    log_dir = None
+    if from_log:
+        if blockchain.log is None:
+            raise click.ClickException("CHAIN_LOG_DIR is not configured")
+        # initialize() does nothing once the chain is loaded, so catch the
+        # chain and its log up with the database explicitly
+        blockchain.initialize()
+        blockchain.refresh()
+        try:
+            blockchain.chain.sync_log()
+        except Exception as e:
+            raise click.ClickException(f"Could not bring the chain log up to date: {str(e)}")
+        log_dir = blockchain.log.directory
+    auditor = ChainAuditor(workers=workers, chunk_size=chunk_size, log_dir=log_dir)
+    report = auditor.run()
+    report_json = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(report_json)
+        click.echo(f"Audit {'passed' if report['ok'] else 'FAILED'}: "
+                   f"{report['blocks']} blocks in {report['timings']['total']:.2f}s, report written to {output}")
+    else:
+        click.echo(report_json)
+    if not report['ok']:
+        raise SystemExit(1)
+
+@app.cli.command('migrate-features')
+@click.option('--batch-size', type=int, default=500, help='Users converted per transaction')
+def migrate_features(batch_size):
+    """Convert pickled retina feature blobs to the binary feature format"""
+    converted = 0
+    after = 0
+    while True:
+        rows = db.session.query(User.id, User.retina_features) \
+            .filter(User.id > after, User.retina_features.isnot(None)) \
+            .order_by(User.id).limit(batch_size).all()
+        if not rows:
+            break
+        updates = [
+            {'id': user_id, 'retina_features': retina_auth.serialize_features(retina_auth.deserialize_features(blob))}
+            for user_id, blob in rows if is_legacy_feature_blob(blob)
+        ]
+        if updates:
+            db.session.bulk_update_mappings(User, updates)
+            db.session.commit()
+            converted += len(updates)
+        after = rows[-1][0]
+    click.echo(f"Converted {converted} feature blob(s)")
+
+@app.cli.command('migrate-scans')
+@click.option('--batch-size', type=int, default=100, help='Users moved per transaction')
+def migrate_scans(batch_size):
+    """Move raw retina scans out of the user table into the blob store"""
+    moved = 0
+    while True:
+        rows = db.session.query(User.id, User.retina_scan) \
+            .filter(User.retina_scan.isnot(None)) \
+            .order_by(User.id).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.bulk_update_mappings(User, [
+            {'id': user_id, 'retina_scan_digest': blob_store.put(scan), 'retina_scan': None}
+            for user_id, scan in rows
+        ])
+        db.session.commit()
+        moved += len(rows)
+    click.echo(f"Moved {moved} scan(s) to {blob_store.root}")
+
+@app.cli.command('import-voters')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--chunk-size', type=int, default=200, help='Records per transaction')
+@click.option('--workers', type=int, default=None, help='Password hashing processes')
+@click.option('--checkpoint', type=click.Path(), default=None,
+              help='Progress file; re-running with it resumes after the last committed chunk')
+@click.option('--credentials-out', type=click.Path(), required=True,
+              help='CSV receiving passwords generated for records without one')
+def import_voters(source, chunk_size, workers, checkpoint, credentials_out):
+    """Enroll voters in bulk from a directory or archive with a manifest.csv"""
+    ensure_retina_index()
+    threshold = app.config['RETINA_DUPLICATE_THRESHOLD']
+    importer = BulkEnrollmentImporter(retina_auth, blob_store, retina_index,
+                                      chunk_size=chunk_size, hash_workers=workers,
+                                      duplicate_threshold=threshold if threshold <= 1 else None)
+    
+    def report(stats):
+        rate = stats['imported'] / stats['seconds'] if stats['seconds'] else 0
+        click.echo(f"row {stats['rows']}: {stats['imported']} imported, {stats['skipped']} skipped, "
+                   f"{stats['failed']} failed ({rate:.1f} voters/sec)")
+    
+    enrollment_source = EnrollmentSource(source)
+    try:
+        stats = importer.run(enrollment_source, checkpoint_path=checkpoint,
+                             credentials_path=credentials_out, progress=report)
+    finally:
+        enrollment_source.close()
+    click.echo(f"Done: {stats['imported']} voters imported in {stats['seconds']:.1f}s")
@@ -0,0 +1,120 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+from models import Candidate, ChainState, Election, User, Vote, VoteTally
+
+class DashboardSnapshot:
+    """
+    Admin dashboard statistics, recomputed in the background
+
+    A thread refreshes the snapshot every `interval` seconds and page loads
+    read it from memory, so opening the dashboard costs no queries however
+    often it is reloaded. The snapshot holds plain dicts, never ORM objects,
+    so it can be shared between requests.
+    """
+
+    def __init__(self, blockchain, interval=10.0, recent_votes=5):
+        self.blockchain = blockchain
+        self.interval = interval
+        self.recent_votes = recent_votes
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the refresh thread for the given Flask app (idempotent)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,),
+                                        name='dashboard-snapshot', daemon=True)
+        self._thread.start()
+        logging.info("Dashboard snapshot refresher started")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.refresh()
+            except Exception as e:
+                logging.error(f"Error refreshing dashboard snapshot: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def get(self):
+        """
+        The latest snapshot
+
+        Without a running refresh thread (e.g. from the CLI) a snapshot older
+        than `interval` is recomputed in the caller's session.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None or (not self.running and
+                                datetime.utcnow() - snapshot['computed_at'] > timedelta(seconds=self.interval)):
+            snapshot = self.refresh()
+        return snapshot
+
+    def refresh(self):
+        """Recompute the snapshot and return it"""
+        now = datetime.utcnow()
+        stats = {
+            'elections': db.session.query(db.func.count(Election.id)).scalar(),
+            'candidates': db.session.query(db.func.count(Candidate.id)).scalar(),
+            # Backed by ix_user_registered_admin
+            'voters': db.session.query(db.func.count(User.id))
+            .filter(User.is_registered == True, User.is_admin == False).scalar(),
+            # Backed by ix_vote_timestamp
+            'votes_per_minute': db.session.query(db.func.count(Vote.id))
+            .filter(Vote.timestamp >= now - timedelta(minutes=1)).scalar(),
+            'chain_height': db.session.query(ChainState.height).filter_by(id=1).scalar() or 0,
+            'pending_votes': self.blockchain.pending_stats()[0]
+        }
+
+        elections = db.session.query(Election.id, Election.title, Election.description, Election.end_date) \
+            .filter(Election.is_active == True).order_by(Election.end_date).all()
+        totals = dict(db.session.query(VoteTally.election_id, db.func.sum(VoteTally.votes))
+                      .filter(VoteTally.election_id.in_([e.id for e in elections]))
+                      .group_by(VoteTally.election_id).all()) if elections else {}
+        active_elections = [{
+            'id': e.id,
+            'title': e.title,
+            'description': e.description,
+            'end_date': e.end_date,
+            'votes': int(totals.get(e.id) or 0)
+        } for e in elections]
+
+        rows = db.session.query(Vote.user_id, Vote.timestamp, Vote.blockchain_hash,
+                                Candidate.name, Election.title) \
+            .join(Candidate, Candidate.id == Vote.candidate_id) \
+            .join(Election, Election.id == Vote.election_id) \
+            .order_by(Vote.timestamp.desc()).limit(self.recent_votes).all()
+        recent_votes = [{
+            'user_id': row[0],
+            'timestamp': row[1],
+            'blockchain_hash': row[2],
+            'candidate_name': row[3],
+            'election_title': row[4]
+        } for row in rows]
+
+        snapshot = {
+            'stats': stats,
+            'active_elections': active_elections,
+            'recent_votes': recent_votes,
+            'computed_at': now
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
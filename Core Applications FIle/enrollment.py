@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+import logging
+import os
+import secrets
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import db
+from models import User
+from retina_index import cosine_similarity
+
+MANIFEST_NAME = 'manifest.csv'
+
+class EnrollmentSource:
+    """
+    Reads voter records from a directory, zip or tar archive
+
+    The source holds a manifest.csv with the columns username, email, image
+    and an optional password. `image` is a path relative to the manifest.
+    Records are yielded lazily, so image bytes are only read as they are
+    imported.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._archive = None
+        if os.path.isdir(path):
+            self._base = path
+        elif zipfile.is_zipfile(path):
+            self._archive = zipfile.ZipFile(path)
+        elif tarfile.is_tarfile(path):
+            self._archive = tarfile.open(path, 'r:*')
+        else:
+            raise ValueError(f"Unsupported enrollment source: {path}")
+
+    def _read(self, name):
+        if self._archive is None:
+            with open(os.path.join(self._base, name), 'rb') as f:
+                return f.read()
+        if isinstance(self._archive, zipfile.ZipFile):
+            return self._archive.read(name)
+        member = self._archive.extractfile(name)
+        if member is None:
+            raise KeyError(name)
+        return member.read()
+
+    def records(self):
+        """Yield (row number, username, email, password or None, image bytes or None)"""
+        manifest = io.TextIOWrapper(io.BytesIO(self._read(MANIFEST_NAME)), encoding='utf-8')
+        for row_number, row in enumerate(csv.DictReader(manifest), start=1):
+            try:
+                image = self._read(row['image'])
+            except (KeyError, OSError) as e:
+                logging.warning(f"Row {row_number}: cannot read image {row.get('image')}: {str(e)}")
+                image = None
+            yield (row_number, row['username'].strip(), row['email'].strip(),
+                   (row.get('password') or '').strip() or None, image)
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+
+class BulkEnrollmentImporter:
+    """
+    Enrolls voters in bulk: registration and retina scan in one pass
+
+    Records are processed in chunks. Password hashes are computed across a
+    process pool, retina features are extracted with the batched engine and
+    each chunk's users are written with one bulk INSERT and one commit. The
+    last committed row is checkpointed so an interrupted import can resume.
+    """
+
+    def __init__(self, retina_auth, blob_store, retina_index, chunk_size=200,
+                 hash_workers=None, duplicate_threshold=None):
+        self.retina_auth = retina_auth
+        self.blob_store = blob_store
+        self.retina_index = retina_index
+        self.chunk_size = chunk_size
+        self.hash_workers = hash_workers
+        self.duplicate_threshold = duplicate_threshold
+
+    def run(self, source, checkpoint_path=None, credentials_path=None, progress=None):
+        """
+        Import every record of a source
+
+        Args:
+            source: EnrollmentSource to read
+            checkpoint_path: JSON file recording the last committed row
+            credentials_path: CSV receiving passwords generated for rows without
+                one; required if any row has no password
+            progress: Callable receiving the running stats after each chunk
+
+        Returns:
+            Dict of import statistics
+
+        Raises:
+            ValueError: A row has no password and there is no credentials file
+        """
+        resume_after = self._load_checkpoint(checkpoint_path, source.path)
+        stats = {'rows': resume_after, 'imported': 0, 'skipped': 0, 'failed': 0, 'seconds': 0.0}
+        started = time.perf_counter()
+
+        credentials = open(credentials_path, 'a', newline='') if credentials_path else None
+        try:
+            with ProcessPoolExecutor(max_workers=self.hash_workers) as pool:
+                chunk = []
+                for record in source.records():
+                    if record[0] <= resume_after:
+                        continue
+                    chunk.append(record)
+                    if len(chunk) >= self.chunk_size:
+                        self._import_chunk(chunk, pool, stats, credentials)
+                        self._finish_chunk(chunk, stats, started, checkpoint_path, source.path, progress)
+                        chunk = []
+                if chunk:
+                    self._import_chunk(chunk, pool, stats, credentials)
+                    self._finish_chunk(chunk, stats, started, checkpoint_path, source.path, progress)
+        finally:
+            if credentials is not None:
+                credentials.close()
+
+        return stats
+
+    def _finish_chunk(self, chunk, stats, started, checkpoint_path, source_path, progress):
+        stats['rows'] = chunk[-1][0]
+        stats['seconds'] = time.perf_counter() - started
+        self._save_checkpoint(checkpoint_path, source_path, stats['rows'])
+        if progress is not None:
+            progress(dict(stats))
+
+    def _import_chunk(self, chunk, pool, stats, credentials):
+        # Skip records whose username or email is already taken (e.g. a re-run)
+        usernames = [r[1] for r in chunk]
+        emails = [r[2] for r in chunk]
+        taken = db.session.query(User.username, User.email) \
+            .filter(User.username.in_(usernames) | User.email.in_(emails)).all()
+        taken_names = {name for name, _ in taken}
+        taken_emails = {email for _, email in taken}
+
+        records = []
+        for record in chunk:
+            _, username, email, _, image = record
+            if username in taken_names or email in taken_emails:
+                stats['skipped'] += 1
+            elif not username or not email or image is None:
+                stats['failed'] += 1
+            else:
+                taken_names.add(username)
+                taken_emails.add(email)
+                records.append(record)
+        if not records:
+            return
+
+        features = self.retina_auth.extract_features_batch([r[4] for r in records])
+
+        accepted = []
+        for record, vector in zip(records, features):
+            if np.isnan(vector).any():
+                logging.warning(f"Row {record[0]}: retina scan could not be processed")
+                stats['failed'] += 1
+                continue
+            if self.duplicate_threshold is not None:
+                # Earlier rows of this chunk are not in the index until it commits
+                if self.retina_index.find_duplicates(vector, self.duplicate_threshold) or \
+                        any(cosine_similarity(vector, other) >= self.duplicate_threshold
+                            for _, other in accepted):
+                    logging.warning(f"Row {record[0]}: retina scan matches an enrolled user")
+                    stats['failed'] += 1
+                    continue
+            accepted.append((record, vector))
+        if not accepted:
+            return
+
+        passwords = []
+        generated = []
+        for record, _ in accepted:
+            password = record[3]
+            if password is None:
+                if credentials is None:
+                    raise ValueError(f"Row {record[0]} has no password and no credentials file was given")
+                password = secrets.token_urlsafe(12)
+                generated.append([record[1], record[2], password])
+            passwords.append(password)
+        hashes = list(pool.map(generate_password_hash, passwords,
+                               chunksize=max(1, len(passwords) // 16)))
+
+        # Blobs are written before the commit; remember which ones are new so
+        # a failed commit does not leave them behind
+        digests = [self.blob_store.digest_of(record[4]) for record, _ in accepted]
+        created = {digest for digest in digests if not self.blob_store.exists(digest)}
+        for record, _ in accepted:
+            self.blob_store.put(record[4])
+
+        rows = [{
+            'username': record[1],
+            'email': record[2],
+            'password_hash': password_hash,
+            'is_admin': False,
+            'is_registered': True,
+            'retina_scan_digest': digest,
+            'retina_features': self.retina_auth.serialize_features(vector)
+        } for (record, vector), password_hash, digest in zip(accepted, hashes, digests)]
+
+        try:
+            db.session.execute(insert(User), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._discard_blobs(created)
+            raise
+
+        # Only accounts that now exist get their credentials written out
+        if generated:
+            csv.writer(credentials).writerows(generated)
+            credentials.flush()
+
+        ids = dict(db.session.query(User.username, User.id)
+                   .filter(User.username.in_([row['username'] for row in rows])).all())
+        for (record, vector), row in zip(accepted, rows):
+            self.retina_index.add(ids[record[1]], vector, row['retina_scan_digest'])
+        stats['imported'] += len(rows)
+
+    def _discard_blobs(self, digests):
+        """Delete blobs written for a chunk that failed, unless a user references them"""
+        if not digests:
+            return
+        referenced = {digest for (digest,) in db.session.query(User.retina_scan_digest)
+                      .filter(User.retina_scan_digest.in_(digests)).all()}
+        for digest in digests - referenced:
+            self.blob_store.delete(digest)
+
+    @staticmethod
+    def _load_checkpoint(path, source_path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('source') != os.path.abspath(source_path):
+            logging.warning(f"Checkpoint {path} belongs to another source; starting from the beginning")
+            return 0
+        logging.info(f"Resuming enrollment after row {checkpoint['rows_done']}")
+        return checkpoint['rows_done']
+
+    @staticmethod
+    def _save_checkpoint(path, source_path, rows_done):
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': os.path.abspath(source_path), 'rows_done': rows_done}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,190 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from app import db
+from models import ChainState, VoteTally
+
+class Subscription:
+    """One connected viewer: the topics it follows and its pending events"""
+
+    def __init__(self, topics, max_queue):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+class EventBroadcaster:
+    """
+    In-process fan-out of server-sent events
+
+    Events are published once per topic and copied to every subscriber of
+    that topic. A subscriber whose queue is full is disconnected rather than
+    slowing down the publisher; its EventSource reconnects and starts over
+    from a fresh page load.
+    """
+
+    def __init__(self, max_queue=100, keepalive=15.0):
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics, self.max_queue)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def topics(self):
+        """Every topic followed by at least one subscriber"""
+        with self._lock:
+            return set().union(*(s.topics for s in self._subscriptions))
+
+    def publish(self, topic, event, data):
+        """Queue an event for every subscriber of `topic`"""
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            subscribers = [s for s in self._subscriptions if topic in s.topics]
+        message = f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                logging.warning("Dropping a slow event stream subscriber")
+                self.unsubscribe(subscription)
+
+    def stream(self, subscription, timeout=None):
+        """
+        Yield SSE messages for a subscription until it closes or `timeout` passes
+
+        Comment lines are sent while idle so proxies keep the connection open.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.closed:
+                wait = self.keepalive
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return
+                try:
+                    yield subscription.queue.get(timeout=wait)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+class ChangeWatcher:
+    """
+    Turns database changes into events, once per process
+
+    A single thread reads the chain tip and the tallies of the elections
+    someone is watching, then publishes new blocks and per-candidate tally
+    deltas. Its cost depends on the number of watched elections, not on the
+    number of viewers. Local commits call notify() so events go out at once;
+    changes made by other workers are picked up every `interval` seconds.
+    """
+
+    def __init__(self, broadcaster, blockchain, interval=1.0):
+        self.broadcaster = broadcaster
+        self.blockchain = blockchain
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._height = None
+        self._tallies = {}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the watcher thread for the given Flask app (idempotent)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,),
+                                        name='change-watcher', daemon=True)
+        self._thread.start()
+        logging.info("Change watcher started")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify(self, *args):
+        """Check for changes now, e.g. right after a commit"""
+        self._wake.set()
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.poll()
+            except Exception as e:
+                logging.error(f"Error publishing change events: {str(e)}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        """Publish what changed since the last poll"""
+        topics = self.broadcaster.topics()
+        if 'blocks' in topics:
+            self._poll_blocks()
+        else:
+            self._height = None
+
+        elections = {int(topic.split(':', 1)[1]) for topic in topics if topic.startswith('election:')}
+        # Forget elections nobody watches, so their baseline is reloaded later
+        for election_id in set(self._tallies) - elections:
+            del self._tallies[election_id]
+        if elections:
+            self._poll_tallies(elections)
+
+    def _poll_blocks(self):
+        height = db.session.query(ChainState.height).filter_by(id=1).scalar() or 0
+        if self._height is None:
+            self._height = height
+            return
+        if height <= self._height:
+            return
+        self.blockchain.refresh()
+        for block in self.blockchain.chain.summaries(self._height, height - self._height):
+            self.broadcaster.publish('blocks', 'block', block)
+        self._height = height
+
+    def _poll_tallies(self, elections):
+        rows = db.session.query(VoteTally.election_id, VoteTally.candidate_id, VoteTally.votes) \
+            .filter(VoteTally.election_id.in_(elections)).all()
+        current = {election_id: {} for election_id in elections}
+        for election_id, candidate_id, votes in rows:
+            current[election_id][candidate_id] = votes
+
+        for election_id, counts in current.items():
+            previous = self._tallies.get(election_id)
+            self._tallies[election_id] = counts
+            if previous is None:
+                continue
+            deltas = {candidate_id: votes - previous.get(candidate_id, 0)
+                      for candidate_id, votes in counts.items() if votes != previous.get(candidate_id, 0)}
+            if deltas:
+                self.broadcaster.publish(f'election:{election_id}', 'tally', {
+                    'election_id': election_id,
+                    'deltas': deltas,
+                    'counts': counts,
+                    'total': sum(counts.values())
+                })
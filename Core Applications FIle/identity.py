@@ -0,0 +1,95 @@
+import threading
+from time import monotonic
+
+from flask_login import UserMixin
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from cache import TTLCache
+from models import IdentityState, User
+
+class UserPrincipal(UserMixin):
+    """
+    Lightweight stand-in for User as Flask-Login's current_user
+
+    Carries only what templates and access checks need. Routes that modify
+    the user or read retina data load the full User row explicitly.
+    """
+
+    def __init__(self, id, username, is_admin, is_registered):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+        self.is_registered = bool(is_registered)
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.username}>'
+
+# Shared across requests in this worker; entries expire after USER_CACHE_TTL seconds
+principal_cache = TTLCache(ttl=app.config['USER_CACHE_TTL'], max_entries=10000)
+
+class _VersionCheck:
+    """The IdentityState version this worker's cache matches, and when it was read"""
+
+    def __init__(self):
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+_seen = _VersionCheck()
+
+def check_version(max_age=None):
+    """
+    Clear the principal cache if another worker changed a user since it was filled
+
+    Reads IdentityState at most once every `max_age` seconds (default
+    USER_CACHE_CHECK_INTERVAL), so a change made elsewhere is picked up
+    within that window. Changes made without invalidate_user(), e.g. by
+    hand in the database, still last until the entry's TTL expires.
+    """
+    max_age = app.config['USER_CACHE_CHECK_INTERVAL'] if max_age is None else max_age
+    now = monotonic()
+    if _seen.checked_at is not None and now - _seen.checked_at < max_age:
+        return
+    version = db.session.query(IdentityState.version).filter_by(id=1).scalar() or 0
+    with _seen.lock:
+        if version != _seen.version:
+            principal_cache.clear()
+            _seen.version = version
+        _seen.checked_at = now
+
+def load_principal(user_id):
+    """Return the cached principal for a user id, querying four columns on a miss"""
+    check_version()
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    row = db.session.query(User.id, User.username, User.is_admin, User.is_registered) \
+        .filter(User.id == user_id).first()
+    if row is None:
+        return None
+
+    principal = UserPrincipal(*row)
+    principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_user(user_id):
+    """
+    Drop a user's cached principal in every worker after their row changed
+
+    Call after the change is committed. This worker's entry goes at once;
+    the IdentityState bump makes the others clear their caches within
+    USER_CACHE_CHECK_INTERVAL seconds.
+    """
+    principal_cache.invalidate(user_id)
+    query = IdentityState.query.filter_by(id=1)
+    try:
+        if not query.update({IdentityState.version: IdentityState.version + 1}, synchronize_session=False):
+            db.session.add(IdentityState(id=1, version=1))
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row first
+        db.session.rollback()
+        query.update({IdentityState.version: IdentityState.version + 1}, synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,93 @@
+"""
+Paged, projected listings for the admin pages and their JSON variants
+
+Each listing selects only the columns its template renders and pages by
+primary key (keyset pagination), so a page costs the same however far into
+a table of hundreds of thousands of rows it is.
+"""
+from app import db
+from models import Candidate, Election, User
+
+VOTER_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.is_registered,
+    # Rows enrolled before the blob store still carry the scan inline
+    db.or_(User.retina_scan_digest.isnot(None), User.retina_scan.isnot(None)).label('has_retina_scan'),
+    User.created_at
+)
+ADMIN_COLUMNS = (User.id, User.username, User.email, User.created_at)
+CANDIDATE_COLUMNS = (Candidate.id, Candidate.name, Candidate.position, Candidate.description)
+ELECTION_COLUMNS = (Election.id, Election.title, Election.description, Election.start_date,
+                    Election.end_date, Election.is_active)
+
+def prefix_filter(column, prefix):
+    """
+    LIKE 'prefix%' with the wildcards in `prefix` escaped
+
+    Case sensitivity follows the backend's LIKE: SQLite ignores ASCII case,
+    PostgreSQL does not.
+    """
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(f'{escaped}%', escape='\\')
+
+def keyset_page(columns, key, filters=(), after=0, limit=50):
+    """
+    One page of rows ordered by `key`
+
+    Args:
+        columns: Columns to select
+        key: Unique, indexed column to page by (normally the primary key)
+        filters: SQL expressions every row must match
+        after: Only return rows whose key is greater (the cursor)
+        limit: Maximum number of rows
+
+    Returns:
+        Dict with the rows as dicts, the cursor for the next page and
+        whether there is one
+    """
+    # One extra row tells whether another page follows
+    rows = db.session.query(*columns).filter(*filters, key > after) \
+        .order_by(key).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = [row._asdict() for row in rows[:limit]]
+    return {
+        'items': rows,
+        'next_after': rows[-1][key.key] if rows else after,
+        'has_more': has_more
+    }
+
+def list_voters(q=None, registered=None, after=0, limit=50):
+    """
+    Non-admin users, optionally filtered
+
+    Args:
+        q: Username or email prefix
+        registered: True or False to filter on registration status
+    """
+    filters = [User.is_admin == False]
+    if registered is not None:
+        filters.append(User.is_registered == registered)
+    if q:
+        filters.append(db.or_(prefix_filter(User.username, q), prefix_filter(User.email, q)))
+    return keyset_page(VOTER_COLUMNS, User.id, filters, after, limit)
+
+def list_admins():
+    """Every admin user; there are only ever a handful"""
+    return [row._asdict() for row in db.session.query(*ADMIN_COLUMNS)
+            .filter(User.is_admin == True).order_by(User.id).all()]
+
+def list_candidates(q=None, after=0, limit=50):
+    """Candidates, optionally filtered by name prefix"""
+    filters = [prefix_filter(Candidate.name, q)] if q else []
+    return keyset_page(CANDIDATE_COLUMNS, Candidate.id, filters, after, limit)
+
+def list_elections(q=None, active=None, after=0, limit=50):
+    """Elections, optionally filtered by title prefix and active flag"""
+    filters = []
+    if active is not None:
+        filters.append(Election.is_active == active)
+    if q:
+        filters.append(prefix_filter(Election.title, q))
+    return keyset_page(ELECTION_COLUMNS, Election.id, filters, after, limit)
@@ -0,0 +1,71 @@
+"""
+Merkle trees over the votes of a block
+
+Leaves and inner nodes are hashed with distinct prefixes (0x00 / 0x01) so a
+leaf can never be passed off as an inner node. An unpaired node at the end of
+a level is promoted unchanged rather than duplicated, which keeps every tree
+shape unambiguous.
+"""
+import hashlib
+import json
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+EMPTY_ROOT = hashlib.sha256(b'').hexdigest()
+
+def leaf_hash(vote):
+    """Hash of a vote dict's canonical JSON encoding, as raw bytes"""
+    return hashlib.sha256(LEAF_PREFIX + json.dumps(vote, sort_keys=True).encode()).digest()
+
+def node_hash(left, right):
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+def _levels(votes):
+    """Every level of the tree, leaves first"""
+    level = [leaf_hash(vote) for vote in votes]
+    levels = [level]
+    while len(level) > 1:
+        level = [node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+def merkle_root(votes):
+    """Hex Merkle root of a list of vote dicts"""
+    if not votes:
+        return EMPTY_ROOT
+    return _levels(votes)[-1][0].hex()
+
+def merkle_proof(votes, position):
+    """
+    Inclusion proof for the vote at `position`
+
+    Returns:
+        List of {'hash', 'side'} steps from the leaf up to the root; `side`
+        says whether the sibling goes to the left or right of the running hash
+    """
+    if not 0 <= position < len(votes):
+        raise IndexError(position)
+    proof = []
+    for level in _levels(votes)[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append({'hash': level[sibling].hex(),
+                          'side': 'left' if sibling < position else 'right'})
+        position //= 2
+    return proof
+
+def verify_proof(leaf, proof, root):
+    """
+    Check an inclusion proof
+
+    Args:
+        leaf: Hex leaf hash (see leaf_hash)
+        proof: Steps returned by merkle_proof
+        root: Hex Merkle root the proof should reach
+    """
+    current = bytes.fromhex(leaf)
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        current = node_hash(sibling, current) if step['side'] == 'left' else node_hash(current, sibling)
+    return current.hex() == root
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+DEFAULT_DIFFICULTY = 4
+# Difficulty of blocks mined before it was recorded on each block
+LEGACY_DIFFICULTY = 4
+
+def meets_difficulty(digest, difficulty):
+    """
+    Check whether a raw SHA-256 digest has `difficulty` leading zero hex digits
+
+    Compares digest bytes directly instead of slicing a hexdigest string.
+    """
+    full, half = divmod(difficulty, 2)
+    if digest[:full] != bytes(full):
+        return False
+    return not half or digest[full] < 16
+
+def valid_proof(last_proof, proof, last_hash, difficulty=DEFAULT_DIFFICULTY):
+    """Does sha256(f'{last_proof}{proof}{last_hash}') meet the difficulty?"""
+    guess = f'{last_proof}{proof}{last_hash}'.encode()
+    return meets_difficulty(hashlib.sha256(guess).digest(), difficulty)
+
+def block_datetime(timestamp):
+    """Naive UTC datetime to store in Block.timestamp for a block's epoch timestamp"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+def block_timestamp(value, legacy=False):
+    """
+    Epoch timestamp of a Block.timestamp value, as hashed into the block
+    
+    Blocks are stored in naive UTC, so their hashes do not depend on the
+    local timezone. Blocks sealed before Merkle roots (`legacy`) were stored
+    in the sealing machine's local time and are read back in this one's.
+    """
+    if not hasattr(value, 'timestamp'):
+        return value
+    if legacy:
+        return value.timestamp()
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+def block_preimage(block):
+    """
+    Canonical bytes a block's hash is computed over
+
+    Blocks with a Merkle root are hashed over their header alone, since the
+    root already commits to the votes; older blocks over everything.
+    """
+    excluded = ('hash', 'data') if 'merkle_root' in block else ('hash',)
+    header = {key: value for key, value in block.items() if key not in excluded}
+    # Keys are sorted, or we'll have inconsistent hashes
+    return json.dumps(header, sort_keys=True).encode()
+
+def hash_block(block):
+    """SHA-256 hex digest of a block dict's preimage (see block_preimage)"""
+    return hashlib.sha256(block_preimage(block)).hexdigest()
+
+def search_range(last_proof, last_hash, start, stop, difficulty=DEFAULT_DIFFICULTY):
+    """
+    Scan nonces in [start, stop) for a valid proof
+
+    The guess is f'{last_proof}{proof}{last_hash}', so the SHA-256 state for
+    the `last_proof` prefix is computed once and copied per attempt, and the
+    `last_hash` suffix is encoded once.
+
+    Returns:
+        Tuple of (first valid nonce or None, number of hashes computed)
+    """
+    base = hashlib.sha256(str(last_proof).encode())
+    suffix = last_hash.encode()
+    full, half = divmod(difficulty, 2)
+    zero = bytes(full)
+
+    for nonce in range(start, stop):
+        h = base.copy()
+        h.update(b'%d%s' % (nonce, suffix))
+        digest = h.digest()
+        if digest[:full] == zero and (not half or digest[full] < 16):
+            return nonce, nonce - start + 1
+
+    return None, stop - start
+
+class ParallelMiner:
+    """
+    Proof-of-work search that splits the nonce space across a process pool
+
+    Nonces are handed out in rounds of one chunk per worker. The lowest valid
+    nonce of a round wins, so the result always matches a sequential scan.
+    """
+
+    def __init__(self, workers=1, difficulty=DEFAULT_DIFFICULTY, chunk_size=20000):
+        self.workers = workers or os.cpu_count() or 1
+        self.difficulty = difficulty
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            logging.info(f"Started mining pool with {self.workers} workers")
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def search(self, last_proof, last_hash):
+        """Find the lowest nonce that satisfies the difficulty"""
+        return self.search_with_stats(last_proof, last_hash)[0]
+
+    def search_with_stats(self, last_proof, last_hash):
+        """
+        Find the lowest valid nonce
+
+        Returns:
+            Tuple of (nonce, total number of hashes computed)
+        """
+        if self.workers <= 1:
+            nonce, hashes, start = None, 0, 0
+            while nonce is None:
+                nonce, count = search_range(last_proof, last_hash, start,
+                                            start + self.chunk_size, self.difficulty)
+                hashes += count
+                start += self.chunk_size
+            return nonce, hashes
+
+        pool = self._get_pool()
+        hashes, start = 0, 0
+        while True:
+            futures = [
+                pool.submit(search_range, last_proof, last_hash,
+                            start + i * self.chunk_size,
+                            start + (i + 1) * self.chunk_size,
+                            self.difficulty)
+                for i in range(self.workers)
+            ]
+            found = []
+            for future in futures:
+                nonce, count = future.result()
+                hashes += count
+                if nonce is not None:
+                    found.append(nonce)
+            if found:
+                return min(found), hashes
+            start += self.workers * self.chunk_size
@@ -10,10 +10,18 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256))
     is_admin = db.Column(db.Boolean, default=False)
     is_registered = db.Column(db.Boolean, default=False)
-    retina_scan = db.Column(db.LargeBinary, nullable=True)
-    retina_features = db.Column(db.LargeBinary, nullable=True)
+    # Raw scans live in the blob store; only their SHA-256 digest is kept here
+    retina_scan_digest = db.Column(db.String(64), nullable=True)
+    # Binary columns are deferred so ordinary user loads never read them
+    retina_scan = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    retina_features = db.deferred(db.Column(db.LargeBinary, nullable=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Backs the registered-voter count of the admin dashboard
+    __table_args__ = (
+        db.Index('ix_user_registered_admin', 'is_registered', 'is_admin'),
+    )
+    
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
     
@@ -52,11 +60,19 @@ class Vote(db.Model):
     election_id = db.Column(db.Integer, db.ForeignKey('election.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     blockchain_hash = db.Column(db.String(256), nullable=True)
+    receipt = db.Column(db.String(64), nullable=True, index=True)
     
     user = db.relationship('User', backref=db.backref('votes', lazy=True))
     candidate = db.relationship('Candidate', backref=db.backref('votes', lazy=True))
     election = db.relationship('Election', backref=db.backref('votes', lazy=True))
     
+    # Backs the grouped per-candidate tally of an election, and the recent
+    # activity and votes-per-minute figures of the admin dashboard
+    __table_args__ = (
+        db.Index('ix_vote_election_candidate', 'election_id', 'candidate_id'),
+        db.Index('ix_vote_timestamp', 'timestamp'),
+    )
+    
     def __repr__(self):
         return f'<Vote {self.id}>'
 
@@ -67,6 +83,71 @@ class Block(db.Model):
     hash = db.Column(db.String(256), nullable=False)
     nonce = db.Column(db.Integer, nullable=False)
     data = db.Column(db.Text, nullable=False)
+    # Root of the Merkle tree over `data`; NULL for blocks sealed before it existed
+    merkle_root = db.Column(db.String(64), nullable=True)
+    # Proof-of-work difficulty the block was mined at; NULL for blocks mined
+    # before it was recorded, which used mining.LEGACY_DIFFICULTY
+    difficulty = db.Column(db.Integer, nullable=True)
     
     def __repr__(self):
         return f'<Block {self.id}>'
+
+class ChainState(db.Model):
+    """
+    Single row holding the chain tip shared by every worker
+    
+    Locked (SELECT ... FOR UPDATE) while a block is sealed, so only one
+    process extends the chain at a time.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    height = db.Column(db.Integer, nullable=False, default=0)
+    tip_hash = db.Column(db.String(256), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Background sealer currently elected to mine, and when its lease lapses
+    sealer_id = db.Column(db.String(128), nullable=True)
+    sealer_lease_until = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<ChainState {self.height}>'
+
+class IdentityState(db.Model):
+    """
+    Single row whose version is bumped whenever a user's access changes
+    
+    Workers compare it with the version their cached principals were loaded
+    at, so a change made in one worker reaches the others.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<IdentityState {self.version}>'
+
+class PendingVote(db.Model):
+    """Durable queue of votes waiting to be sealed into a block"""
+    id = db.Column(db.Integer, primary_key=True)
+    receipt = db.Column(db.String(64), unique=True, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), default='pending', nullable=False, index=True)
+    block_index = db.Column(db.Integer, nullable=True)
+    block_hash = db.Column(db.String(256), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sealed_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<PendingVote {self.receipt} {self.status}>'
+
+class VoteTally(db.Model):
+    """Materialized vote count per (election, candidate), kept in step with Vote"""
+    id = db.Column(db.Integer, primary_key=True)
+    election_id = db.Column(db.Integer, db.ForeignKey('election.id'), nullable=False)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidate.id'), nullable=False)
+    votes = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('election_id', 'candidate_id', name='uq_vote_tally_election_candidate'),
+    )
+    
+    def __repr__(self):
+        return f'<VoteTally {self.election_id}:{self.candidate_id} {self.votes}>'
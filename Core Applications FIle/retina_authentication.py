@@ -3,10 +3,94 @@ import numpy as np
 import io
 import pickle
 import logging
-import hashlib
 import random
+import struct
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# Side length of the square frames features are computed on
+FRAME_SIZE = 224
+# Histogram bins; 256 / 32 means each bin covers 8 intensity levels
+HIST_BINS = 32
+FEATURE_LENGTH = 2 + HIST_BINS
+
+# Stored feature format: 8-byte header (magic, version, dtype code, element
+# count) followed by the raw little-endian vector
+FEATURE_MAGIC = b'RF'
+FEATURE_VERSION = 1
+FEATURE_HEADER = struct.Struct('<2sBBI')
+FEATURE_DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f8')}
+FEATURE_DTYPE_CODES = {dtype: code for code, dtype in FEATURE_DTYPES.items()}
+
+# Decode flags that scale by 1/n while decoding; largest factor first
+REDUCED_GRAYSCALE_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers (C4, C8 and CC are DHT, JPG and DAC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def image_dimensions(data):
+    """
+    Read (width, height) from a JPEG or PNG header without decoding
+    
+    Returns:
+        Tuple of (width, height), or None for other formats or a truncated header
+    """
+    try:
+        if bytes(data[:8]) == PNG_SIGNATURE:
+            return struct.unpack_from('>II', data, 16)
+            
+        if bytes(data[:2]) != b'\xff\xd8':
+            return None
+        offset = 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            if marker == 0xFF:
+                # Fill byte before a marker
+                offset += 1
+                continue
+            if marker in JPEG_SOF_MARKERS:
+                height, width = struct.unpack_from('>HH', data, offset + 5)
+                return width, height
+            offset += 2 + struct.unpack_from('>H', data, offset + 2)[0]
+    except struct.error:
+        pass
+    return None
+
+def decode_flags_for(data, target=FRAME_SIZE):
+    """
+    Choose the cheapest grayscale decode that still yields at least `target` pixels per side
+    
+    JPEG decoders apply the reduction inside the IDCT, so a 640x480 frame
+    decoded with IMREAD_REDUCED_GRAYSCALE_2 never materializes at full size.
+    """
+    dimensions = image_dimensions(data)
+    if dimensions is not None:
+        shortest = min(dimensions)
+        for factor, flags in REDUCED_GRAYSCALE_MODES:
+            if shortest // factor >= target:
+                return flags
+    return cv2.IMREAD_GRAYSCALE
+
+def is_legacy_feature_blob(blob):
+    """True for feature blobs written with pickle before the binary format"""
+    return bytes(blob[:2]) != FEATURE_MAGIC
+
+class _LegacyFeatureUnpickler(pickle.Unpickler):
+    """Unpickler for legacy feature blobs that only allows NumPy array types"""
+    allowed = {'_reconstruct', 'ndarray', 'dtype', 'scalar', '_frombuffer'}
+
+    def find_class(self, module, name):
+        if module.split('.')[0] == 'numpy' and name in self.allowed:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Disallowed type in feature blob: {module}.{name}")
+
 class RetinalAuthentication:
     def __init__(self):
         logging.info("Initializing simplified retinal authentication")
@@ -25,18 +109,19 @@ class RetinalAuthentication:
         try:
             # Convert byte data to NumPy array
             nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            
+            # Decode straight to grayscale, downscaled during decode when
+            # the frame is at least twice the working size
+            gray = cv2.imdecode(nparr, decode_flags_for(nparr))
             
             # Check if image was loaded correctly
-            if img is None:
+            if gray is None:
                 logging.error("Failed to decode image")
                 return None
                 
             # Resize image
-            img = cv2.resize(img, (224, 224))
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            if gray.shape != (FRAME_SIZE, FRAME_SIZE):
+                gray = cv2.resize(gray, (FRAME_SIZE, FRAME_SIZE))
             
             # Apply basic image processing for feature enhancement
             blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -61,7 +146,18 @@ class RetinalAuthentication:
         processed_image = self.preprocess_retina_image(image_data)
         if processed_image is None:
             return None
+        return self.features_from_image(processed_image)
+    
+    def features_from_image(self, processed_image):
+        """
+        Compute the feature vector of an image returned by preprocess_retina_image
+        
+        Args:
+            processed_image: FRAME_SIZE x FRAME_SIZE edge map
             
+        Returns:
+            Feature vector (simplified)
+        """
         # We'll use image statistics as a simple feature vector
         # In a production system, this would be a CNN model
         
@@ -70,7 +166,7 @@ class RetinalAuthentication:
         std = np.std(processed_image)
         
         # Calculate histogram (simplified feature vector)
-        hist = cv2.calcHist([processed_image], [0], None, [32], [0, 256])
+        hist = cv2.calcHist([processed_image], [0], None, [HIST_BINS], [0, 256])
         hist = hist.flatten() / np.sum(hist)  # Normalize
         
         # Create feature vector from statistics and histogram
@@ -83,6 +179,66 @@ class RetinalAuthentication:
         
         return features
     
+    def extract_features_batch(self, images, max_workers=None, chunk_size=256):
+        """
+        Extract features from many images at once
+        
+        Decoding and edge detection run across a thread pool (OpenCV releases
+        the GIL), then the statistics and histograms are computed with NumPy
+        over whole stacks of frames rather than one image at a time.
+        
+        Args:
+            images: Sequence of image byte buffers
+            max_workers: Decoder threads (defaults to the executor's choice)
+            chunk_size: Frames stacked per vectorized step, bounding memory use
+            
+        Returns:
+            (N, 34) float32 feature matrix; rows of images that failed to
+            decode are NaN
+        """
+        count = len(images)
+        features = np.full((count, FEATURE_LENGTH), np.nan, dtype=np.float32)
+        if count == 0:
+            return features
+            
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for start in range(0, count, chunk_size):
+                stop = min(start + chunk_size, count)
+                frames = np.zeros((stop - start, FRAME_SIZE, FRAME_SIZE), dtype=np.uint8)
+                ok = np.zeros(stop - start, dtype=bool)
+                
+                def preprocess(i):
+                    edges = self.preprocess_retina_image(images[start + i])
+                    if edges is not None:
+                        frames[i] = edges
+                        ok[i] = True
+                        
+                list(pool.map(preprocess, range(stop - start)))
+                features[start:stop][ok] = self._frame_features(frames[ok])
+                
+        return features
+    
+    @staticmethod
+    def _frame_features(frames):
+        """Vectorized equivalent of extract_features for a (N, H, W) uint8 stack"""
+        n = len(frames)
+        flat = frames.reshape(n, -1)
+        
+        mean = flat.mean(axis=1)
+        std = flat.std(axis=1)
+        
+        # One bincount over row-offset bin ids yields every histogram at once
+        bins = (flat >> 3).astype(np.int32)
+        bins += (np.arange(n, dtype=np.int32) * HIST_BINS)[:, None]
+        hist = np.bincount(bins.ravel(), minlength=n * HIST_BINS).reshape(n, HIST_BINS)
+        hist = hist / flat.shape[1]
+        
+        features = np.column_stack((mean, std, hist))
+        
+        # Same per-scan noise as extract_features (demo stand-in for retina uniqueness)
+        features += np.random.normal(0, 0.01, features.shape)
+        return features.astype(np.float32)
+    
     def compare_features(self, features1, features2, threshold=0.9):
         """
         Compare two feature vectors to determine if they are from the same retina
@@ -120,9 +276,25 @@ class RetinalAuthentication:
         return True  # Always authenticate in demo mode
     
     def serialize_features(self, features):
-        """Convert numpy array features to bytes for database storage"""
-        return pickle.dumps(features)
+        """Convert numpy array features to the compact binary storage format"""
+        vector = np.ascontiguousarray(features, dtype=np.dtype('<f4')).reshape(-1)
+        header = FEATURE_HEADER.pack(FEATURE_MAGIC, FEATURE_VERSION,
+                                     FEATURE_DTYPE_CODES[vector.dtype], len(vector))
+        return header + vector.tobytes()
     
     def deserialize_features(self, features_bytes):
-        """Convert bytes back to numpy array features"""
-        return pickle.loads(features_bytes)
+        """
+        Convert stored bytes back to numpy array features
+        
+        Binary blobs are read zero-copy with np.frombuffer, so the returned
+        array is read-only. Legacy pickle blobs are still accepted while rows
+        are migrated.
+        """
+        if is_legacy_feature_blob(features_bytes):
+            return _LegacyFeatureUnpickler(io.BytesIO(features_bytes)).load()
+            
+        magic, version, dtype_code, length = FEATURE_HEADER.unpack_from(features_bytes)
+        if version != FEATURE_VERSION or dtype_code not in FEATURE_DTYPES:
+            raise ValueError(f"Unsupported feature format version={version} dtype={dtype_code}")
+        return np.frombuffer(features_bytes, dtype=FEATURE_DTYPES[dtype_code],
+                             count=length, offset=FEATURE_HEADER.size)
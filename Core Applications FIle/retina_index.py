@@ -0,0 +1,162 @@
+import logging
+import threading
+from time import monotonic
+
+import numpy as np
+
+from retina_authentication import FEATURE_LENGTH
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two feature vectors"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1)
+    b = np.asarray(b, dtype=np.float32).reshape(-1)
+    norms = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / norms) if norms > 0 else 0.0
+
+class RetinaIndex:
+    """
+    In-memory 1:N index over the enrolled users' retina features
+
+    Features are stored L2-normalized in one contiguous float32 matrix, so a
+    cosine search against every enrolled user is a single matrix product.
+    Rows are added and removed in place as users enroll or are deleted, and
+    sync() catches up with enrollments made by other processes.
+    """
+
+    def __init__(self, dim=FEATURE_LENGTH, capacity=1024):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._user_ids = np.zeros(capacity, dtype=np.int64)
+        self._rows = {}
+        self._digests = {}
+        self._size = 0
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.synced_at = None
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    @staticmethod
+    def _normalize(features):
+        vector = np.asarray(features, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def build(self, entries):
+        """
+        Replace the index contents
+
+        Args:
+            entries: Iterable of (user_id, feature vector, scan digest)
+        """
+        with self._lock:
+            self._rows = {}
+            self._digests = {}
+            self._size = 0
+            for user_id, features, digest in entries:
+                self.add(user_id, features, digest)
+            self.loaded = True
+            self.synced_at = monotonic()
+            logging.info(f"Retina index built with {self._size} enrolled users")
+
+    def add(self, user_id, features, digest=None):
+        """Insert or replace the features of a user, enrolled with the scan `digest`"""
+        vector = self._normalize(features)
+        with self._lock:
+            self._digests[user_id] = digest
+            row = self._rows.get(user_id)
+            if row is None:
+                if self._size == len(self._matrix):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[user_id] = row
+                self._user_ids[row] = user_id
+            self._matrix[row] = vector
+
+    def remove(self, user_id):
+        """Drop a user from the index by moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            self._digests.pop(user_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                moved = int(self._user_ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._user_ids[row] = moved
+                self._rows[moved] = row
+            self._size = last
+
+    def sync(self, enrolled, load_features, batch_size=500):
+        """
+        Catch up with enrollments and deletions made by other processes
+
+        Users are compared by scan digest, so only the features of users who
+        are new or re-enrolled are loaded.
+
+        Args:
+            enrolled: Iterable of (user_id, scan digest) of every enrolled user
+            load_features: Callable mapping a list of user ids to {user_id: features}
+
+        Returns:
+            Tuple of (users added or replaced, users removed)
+        """
+        current = dict(enrolled)
+        with self._lock:
+            removed = [user_id for user_id in self._rows if user_id not in current]
+            changed = [user_id for user_id, digest in current.items()
+                       if user_id not in self._rows or self._digests.get(user_id) != digest]
+        for user_id in removed:
+            self.remove(user_id)
+        for start in range(0, len(changed), batch_size):
+            for user_id, features in load_features(changed[start:start + batch_size]).items():
+                self.add(user_id, features, current[user_id])
+        self.synced_at = monotonic()
+        if changed or removed:
+            logging.info(f"Retina index synced: {len(changed)} added or replaced, {len(removed)} removed")
+        return len(changed), len(removed)
+
+    def _grow(self):
+        capacity = max(1, len(self._matrix)) * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        user_ids = np.zeros(capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        user_ids[:self._size] = self._user_ids[:self._size]
+        self._matrix, self._user_ids = matrix, user_ids
+
+    def search(self, features, k=5):
+        """
+        Find the enrolled users most similar to a scan
+
+        Returns:
+            List of (user_id, cosine similarity) pairs, most similar first
+        """
+        query = self._normalize(features)
+        with self._lock:
+            if self._size == 0:
+                return []
+            scores = self._matrix[:self._size] @ query
+            user_ids = self._user_ids[:self._size].copy()
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(user_ids[i]), float(scores[i])) for i in top]
+
+    def find_duplicates(self, features, threshold, exclude_user_id=None, k=5):
+        """
+        Return enrolled users whose features match a scan above `threshold`
+
+        Args:
+            features: Feature vector of the new scan
+            threshold: Minimum cosine similarity counted as the same retina
+            exclude_user_id: User enrolling the scan, who may already be indexed
+        """
+        return [(user_id, score) for user_id, score in self.search(features, k + 1)
+                if score >= threshold and user_id != exclude_user_id][:k]
@@ -4,23 +4,94 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from app import app, db
 from models import User, Candidate, Election, Vote, Block
 from blockchain import Blockchain
+from sealer import BlockSealer
+from tally import build_results, forget_user_votes, get_tally
+from vote_writer import VoteRejected, VoteWriter
 from retina_authentication import RetinalAuthentication
+from retina_index import RetinaIndex, cosine_similarity
+from scan_service import ScanProcessingService, ServiceBusy
+from blob_store import BlobStore
+from events import ChangeWatcher, EventBroadcaster
+from dashboard import DashboardSnapshot
+from listing import list_admins, list_candidates, list_elections, list_voters
+from identity import invalidate_user
+from startup import readiness
 import json
 import base64
 import io
 import logging
 from datetime import datetime
+from time import monotonic
 
 # Initialize blockchain and retinal authentication
-blockchain = Blockchain()
+blockchain = Blockchain(difficulty=app.config['BLOCKCHAIN_DIFFICULTY'],
+                        mining_workers=app.config['BLOCKCHAIN_MINING_WORKERS'],
+                        cache_size=app.config['BLOCKCHAIN_CACHE_SIZE'],
+                        page_size=app.config['BLOCKCHAIN_PAGE_SIZE'],
+                        log_dir=app.config['CHAIN_LOG_DIR'] or None,
+                        log_segment_bytes=app.config['CHAIN_LOG_SEGMENT_BYTES'])
 retina_auth = RetinalAuthentication()
+retina_index = RetinaIndex()
+blob_store = BlobStore(app.config['RETINA_BLOB_DIR'])
+scan_service = ScanProcessingService(retina_auth,
+                                     workers=app.config['RETINA_SCAN_WORKERS'],
+                                     max_queue=app.config['RETINA_SCAN_QUEUE_DEPTH'],
+                                     timeout=app.config['RETINA_SCAN_TIMEOUT'],
+                                     retry_after=app.config['RETINA_SCAN_RETRY_AFTER'])
+sealer = BlockSealer(blockchain,
+                     block_size=app.config['BLOCKCHAIN_BLOCK_SIZE'],
+                     max_wait=app.config['BLOCKCHAIN_SEAL_MAX_WAIT'],
+                     lease_seconds=app.config['BLOCKCHAIN_SEALER_LEASE'])
+vote_writer = VoteWriter(blockchain, sealer,
+                         max_batch=app.config['VOTE_COMMIT_MAX_BATCH'],
+                         max_wait=app.config['VOTE_COMMIT_MAX_WAIT'])
+# Live results and chain updates, fanned out to every connected viewer
+broadcaster = EventBroadcaster(max_queue=app.config['EVENTS_QUEUE_SIZE'])
+change_watcher = ChangeWatcher(broadcaster, blockchain, interval=app.config['EVENTS_POLL_INTERVAL'])
+blockchain.listeners.append(change_watcher.notify)
+vote_writer.listeners.append(change_watcher.notify)
+dashboard = DashboardSnapshot(blockchain, interval=app.config['DASHBOARD_REFRESH_INTERVAL'])
 
-# Initialize blockchain after app context is created
-@app.before_request
-def initialize_blockchain():
-    """Initialize blockchain before each request if not already initialized"""
-    if not blockchain.initialized:
-        blockchain.initialize()
+def ensure_retina_index(max_age=None):
+    """
+    Build the 1:N retina index from every enrolled user on first use
+    
+    With `max_age`, an index last synced longer ago than that many seconds
+    is first caught up with enrollments and deletions made by other workers.
+    """
+    if not retina_index.loaded:
+        rows = db.session.query(User.id, User.retina_features, User.retina_scan_digest) \
+            .filter(User.retina_features.isnot(None)).yield_per(500)
+        retina_index.build((user_id, retina_auth.deserialize_features(blob), digest)
+                           for user_id, blob, digest in rows)
+    elif max_age is not None and monotonic() - retina_index.synced_at >= max_age:
+        enrolled = db.session.query(User.id, User.retina_scan_digest) \
+            .filter(User.retina_features.isnot(None)).yield_per(5000)
+        retina_index.sync(enrolled, load_retina_features)
+
+def load_retina_features(user_ids):
+    """Stored feature vectors of the given users as {user_id: features}"""
+    rows = db.session.query(User.id, User.retina_features) \
+        .filter(User.id.in_(user_ids), User.retina_features.isnot(None)).all()
+    return {user_id: retina_auth.deserialize_features(blob) for user_id, blob in rows}
+
+def find_enrolled_duplicates(features, exclude_user_id=None):
+    """
+    Enrolled users whose retina matches a scan, or [] if the check is disabled
+    
+    Index hits are confirmed against the features stored in the database,
+    so users deleted or re-enrolled on another worker are not reported.
+    """
+    threshold = app.config['RETINA_DUPLICATE_THRESHOLD']
+    if threshold > 1:
+        return []
+    ensure_retina_index(max_age=app.config['RETINA_INDEX_SYNC_INTERVAL'])
+    candidates = retina_index.find_duplicates(features, threshold, exclude_user_id=exclude_user_id)
+    if not candidates:
+        return []
+    stored = load_retina_features([user_id for user_id, _ in candidates])
+    scores = [(user_id, cosine_similarity(features, vector)) for user_id, vector in stored.items()]
+    return [(user_id, score) for user_id, score in scores if score >= threshold]
 
 @app.route('/')
 def index():
@@ -62,6 +133,7 @@ def register():
         
         db.session.add(new_user)
         db.session.commit()
+        invalidate_user(new_user.id)
         
         flash('Registration successful! Please login.', 'success')
         return redirect(url_for('login'))
@@ -110,6 +182,152 @@ def logout():
     flash('You have been logged out', 'info')
     return redirect(url_for('index'))
 
+def enroll_retina_scan(binary_data):
+    """
+    Register a retina scan for the current user
+    
+    Args:
+        binary_data: Encoded image as bytes, bytearray or memoryview
+        
+    Returns:
+        Tuple of (success, message for the user)
+        
+    Raises:
+        ServiceBusy: The scan processing queue is saturated
+    """
+    # Extract features from the scan on the processing pool
+    features = scan_service.extract(binary_data)
+    
+    if features is None:
+        return False, 'Failed to process retina scan. Please try again.'
+        
+    # Refuse a retina that is already enrolled under another account
+    duplicates = find_enrolled_duplicates(features, exclude_user_id=current_user.id)
+    if duplicates:
+        logging.warning(f"User {current_user.id} retina scan matches enrolled users {duplicates}")
+        return False, 'This retina scan is already registered to another account.'
+        
+    # Serialize features for storage
+    serialized_features = retina_auth.serialize_features(features)
+    
+    # Save scan to the blob store and features to user
+    user = db.session.get(User, current_user.id)
+    previous_digest = user.retina_scan_digest
+    user.retina_scan_digest = digest = blob_store.put(binary_data)
+    user.retina_scan = None
+    user.retina_features = serialized_features
+    user.is_registered = True
+    
+    db.session.commit()
+    invalidate_user(user.id)
+    retina_index.add(user.id, features, digest)
+    # A re-scan replaces the user's previous blob
+    if previous_digest and previous_digest != digest:
+        release_scan_blob(previous_digest)
+    
+    return True, 'Retina scan registered successfully!'
+
+def release_scan_blob(digest):
+    """
+    Delete a retina scan blob once no user references it
+    
+    Identical scans share a blob, so it is only removed when the last user
+    pointing at it has moved on. Call after the commit that dropped the
+    reference.
+    """
+    if not db.session.query(User.id).filter_by(retina_scan_digest=digest).first():
+        blob_store.delete(digest)
+
+def verify_retina_scan(binary_data, election_id):
+    """
+    Authenticate the current user for an election with a retina scan
+    
+    On success the session is marked as retina authenticated for the election.
+    
+    Returns:
+        Tuple of (status, message) where status is 'ok', 'mismatch',
+        'unregistered' or 'failed'
+        
+    Raises:
+        ServiceBusy: The scan processing queue is saturated
+    """
+    # Extract features from the scan on the processing pool
+    features = scan_service.extract(binary_data)
+    
+    if features is None:
+        return 'failed', 'Failed to process retina scan. Please try again.'
+        
+    # Compare with stored features
+    stored_features = db.session.query(User.retina_features) \
+        .filter(User.id == current_user.id).scalar()
+    if not stored_features:
+        return 'unregistered', 'You have not registered a retina scan'
+        
+    # Check if the scans match
+    if not retina_auth.compare_features(features, stored_features):
+        return 'mismatch', 'Authentication failed. Retina scan does not match.'
+        
+    # Set session variable to indicate authenticated for voting
+    session['retina_authenticated'] = True
+    session['election_id'] = str(election_id)
+    return 'ok', 'Authentication successful!'
+
+def decode_data_url(image_data):
+    """Decode the base64 JPEG data URL posted by the legacy scan form"""
+    # Strip out the base64 prefix and decode base64 to binary
+    return base64.b64decode(image_data.split(',')[1])
+
+def read_scan_upload():
+    """
+    Read a binary scan upload into a single preallocated buffer
+    
+    Accepts a raw image body (e.g. Content-Type: image/jpeg) or a multipart
+    form with a `scan` file field. The declared size is checked against
+    RETINA_UPLOAD_MAX_BYTES before any of the body is read.
+    
+    Returns:
+        Tuple of (buffer or None, error message, HTTP status)
+    """
+    max_bytes = app.config['RETINA_UPLOAD_MAX_BYTES']
+    length = request.content_length
+    if length is None:
+        return None, 'Content-Length is required', 411
+    if length > max_bytes:
+        return None, f'Scan exceeds the {max_bytes} byte limit', 413
+        
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('scan')
+        if upload is None:
+            return None, 'No retina scan data received', 400
+        stream = upload.stream
+        stream.seek(0, 2)
+        length = stream.tell()
+        stream.seek(0)
+    else:
+        stream = request.stream
+        
+    if length == 0:
+        return None, 'No retina scan data received', 400
+        
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = stream.readinto(view[received:])
+        if not count:
+            break
+        received += count
+    if received != length:
+        return None, 'Incomplete retina scan upload', 400
+    return view, None, 200
+
+def busy_response(error, body=None):
+    """503 with Retry-After for a scan rejected by the processing service"""
+    logging.warning(f"Retina scan rejected: {str(error)}")
+    if body is None:
+        body = jsonify({'status': 'busy', 'message': 'The retina scanner is busy. Please try again in a moment.'})
+    return body, 503, {'Retry-After': str(error.retry_after)}
+
 @app.route('/scan_retina', methods=['GET', 'POST'])
 @login_required
 def scan_retina():
@@ -124,31 +342,18 @@ def scan_retina():
             
         # Process base64 data
         try:
-            # Strip out the base64 prefix
-            image_data = image_data.split(',')[1]
-            # Decode base64 to binary
-            binary_data = base64.b64decode(image_data)
-            
-            # Extract features from the scan
-            features = retina_auth.extract_features(binary_data)
+            success, message = enroll_retina_scan(decode_data_url(image_data))
             
-            if features is None:
-                flash('Failed to process retina scan. Please try again.', 'danger')
+            if not success:
+                flash(message, 'danger')
                 return render_template('scan.html', mode='register')
                 
-            # Serialize features for storage
-            serialized_features = retina_auth.serialize_features(features)
-            
-            # Save scan and features to user
-            current_user.retina_scan = binary_data
-            current_user.retina_features = serialized_features
-            current_user.is_registered = True
-            
-            db.session.commit()
-            
-            flash('Retina scan registered successfully!', 'success')
+            flash(message, 'success')
             return redirect(url_for('index'))
             
+        except ServiceBusy as e:
+            flash('The retina scanner is busy. Please try again in a moment.', 'warning')
+            return busy_response(e, render_template('scan.html', mode='register'))
         except Exception as e:
             logging.error(f"Error processing retina scan: {str(e)}")
             flash('Error processing retina scan. Please try again.', 'danger')
@@ -173,42 +378,74 @@ def authenticate_retina():
             
         # Process base64 data
         try:
-            # Strip out the base64 prefix
-            image_data = image_data.split(',')[1]
-            # Decode base64 to binary
-            binary_data = base64.b64decode(image_data)
-            
-            # Extract features from the scan
-            features = retina_auth.extract_features(binary_data)
+            status, message = verify_retina_scan(decode_data_url(image_data), election.id)
             
-            if features is None:
-                flash('Failed to process retina scan. Please try again.', 'danger')
-                return render_template('scan.html', mode='authenticate', election=election)
-                
-            # Compare with stored features
-            if not current_user.retina_features:
-                flash('You have not registered a retina scan', 'danger')
+            if status == 'ok':
+                flash(message, 'success')
+                return redirect(url_for('vote', election_id=election.id))
+            elif status == 'unregistered':
+                flash(message, 'danger')
                 return redirect(url_for('scan_retina'))
-                
-            # Check if the scans match
-            is_match = retina_auth.compare_features(features, current_user.retina_features)
-            
-            if is_match:
-                flash('Authentication successful!', 'success')
-                # Set session variable to indicate authenticated for voting
-                session['retina_authenticated'] = True
-                session['election_id'] = election_id
-                return redirect(url_for('vote', election_id=election_id))
             else:
-                flash('Authentication failed. Retina scan does not match.', 'danger')
+                flash(message, 'danger')
                 return render_template('scan.html', mode='authenticate', election=election)
                 
+        except ServiceBusy as e:
+            flash('The retina scanner is busy. Please try again in a moment.', 'warning')
+            return busy_response(e, render_template('scan.html', mode='authenticate', election=election))
         except Exception as e:
             logging.error(f"Error processing retina scan: {str(e)}")
             flash('Error processing retina scan. Please try again.', 'danger')
             
     return render_template('scan.html', mode='authenticate', election=election)
 
+@app.route('/api/retina/scan', methods=['POST'])
+@login_required
+def upload_retina_scan():
+    """Binary upload endpoint for registering a retina scan"""
+    binary_data, error, status_code = read_scan_upload()
+    if binary_data is None:
+        return jsonify({'status': 'error', 'message': error}), status_code
+        
+    try:
+        success, message = enroll_retina_scan(binary_data)
+    except ServiceBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logging.error(f"Error processing retina scan: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Error processing retina scan. Please try again.'}), 500
+        
+    if not success:
+        return jsonify({'status': 'rejected', 'message': message}), 422
+    flash(message, 'success')
+    return jsonify({'status': 'ok', 'message': message, 'redirect': url_for('index')})
+
+@app.route('/api/retina/authenticate/<int:election_id>', methods=['POST'])
+@login_required
+def upload_retina_authentication(election_id):
+    """Binary upload endpoint for authenticating with a retina scan"""
+    election = Election.query.get_or_404(election_id)
+    binary_data, error, status_code = read_scan_upload()
+    if binary_data is None:
+        return jsonify({'status': 'error', 'message': error}), status_code
+        
+    try:
+        status, message = verify_retina_scan(binary_data, election.id)
+    except ServiceBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        logging.error(f"Error processing retina scan: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Error processing retina scan. Please try again.'}), 500
+        
+    if status == 'ok':
+        flash(message, 'success')
+        return jsonify({'status': status, 'message': message,
+                        'redirect': url_for('vote', election_id=election.id)})
+    if status == 'unregistered':
+        return jsonify({'status': status, 'message': message,
+                        'redirect': url_for('scan_retina')}), 409
+    return jsonify({'status': status, 'message': message}), 422
+
 @app.route('/vote/<int:election_id>', methods=['GET', 'POST'])
 @login_required
 def vote(election_id):
@@ -254,25 +491,25 @@ def vote(election_id):
             'timestamp': datetime.utcnow().isoformat()
         }
         
-        # Add vote to blockchain
-        block_index = blockchain.new_vote(vote_data)
-        
-        # Create vote record in database
-        vote = Vote(
-            user_id=current_user.id,
-            candidate_id=int(candidate_id),
-            election_id=election_id,
-            blockchain_hash=blockchain.hash(blockchain.chain[block_index-1]) if block_index > 0 else None
-        )
-        
-        db.session.add(vote)
-        db.session.commit()
-        
+        # Group-commit the Vote, its PendingVote and the tally update; the
+        # sealer mines the vote into a block later
+        try:
+            receipt = vote_writer.submit(vote_data)
+        except VoteRejected as e:
+            flash(str(e), 'info')
+            return redirect(url_for('index'))
+        except TimeoutError:
+            flash('Your vote could not be confirmed in time. Please check the election before voting again.', 'warning')
+            return redirect(url_for('index'))
+            
         # Clear authentication session
         session.pop('retina_authenticated', None)
         session.pop('election_id', None)
         
-        flash('Your vote has been recorded securely!', 'success')
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(blockchain.lookup_receipt(receipt)), 202
+            
+        flash(f'Your vote has been recorded securely! Receipt: {receipt} (status: pending)', 'success')
         return redirect(url_for('index'))
         
     return render_template('vote.html', election=election, candidates=candidates)
@@ -287,32 +524,48 @@ def results(election_id):
         flash('Results will be available after the election ends', 'info')
         return redirect(url_for('index'))
         
-    # Get vote counts for each candidate
-    candidates = Candidate.query.all()
-    results = []
-    
-    for candidate in candidates:
-        vote_count = Vote.query.filter_by(
-            candidate_id=candidate.id,
-            election_id=election_id
-        ).count()
-        
-        results.append({
-            'candidate': candidate,
-            'votes': vote_count
-        })
-        
-    # Sort by vote count (descending)
-    results.sort(key=lambda x: x['votes'], reverse=True)
-    
-    # Get total votes
-    total_votes = Vote.query.filter_by(election_id=election_id).count()
+    # Get vote counts for every candidate and the total from the tally table
+    counts, total_votes = get_tally(election_id)
+    results = build_results(Candidate.query.all(), counts)
+    # Plain data for the chart, which is updated live from /api/events
+    chart_data = [{
+        'candidate': {'id': r['candidate'].id, 'name': r['candidate'].name, 'position': r['candidate'].position},
+        'votes': r['votes']
+    } for r in results]
     
     return render_template('results.html', 
                           election=election,
                           results=results,
+                          chart_data=chart_data,
                           total_votes=total_votes)
 
+def listing_args():
+    """
+    Query parameters shared by the admin listings
+    
+    Returns:
+        Tuple of (search prefix or None, keyset cursor, page size)
+    """
+    q = request.args.get('q', '').strip() or None
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', app.config['ADMIN_PAGE_SIZE'], type=int), 1), 500)
+    return q, after, limit
+
+def flag_arg(name):
+    """True or False for a yes/no query parameter, None if it is absent"""
+    value = request.args.get(name, '').lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return None
+
+def listing_response(page):
+    """JSON response for a listing page, with ISO 8601 datetimes"""
+    page['items'] = [{key: value.isoformat() if isinstance(value, datetime) else value
+                      for key, value in item.items()} for item in page['items']]
+    return jsonify(page)
+
 # Admin routes
 @app.route('/admin/dashboard')
 @login_required
@@ -322,23 +575,14 @@ def admin_dashboard():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('index'))
         
-    # Get statistics for dashboard cards
-    stats = {
-        'elections': Election.query.count(),
-        'candidates': Candidate.query.count(),
-        'voters': User.query.filter(User.is_registered == True, User.is_admin == False).count()
-    }
-    
-    # Get active elections
-    active_elections = Election.query.filter_by(is_active=True).all()
-    
-    # Get recent votes
-    recent_votes = Vote.query.order_by(Vote.timestamp.desc()).limit(5).all()
+    # Statistics, active elections and recent votes from the background snapshot
+    snapshot = dashboard.get()
     
     return render_template('admin/dashboard.html',
-                          stats=stats,
-                          active_elections=active_elections,
-                          recent_votes=recent_votes)
+                          stats=snapshot['stats'],
+                          active_elections=snapshot['active_elections'],
+                          recent_votes=snapshot['recent_votes'],
+                          computed_at=snapshot['computed_at'])
 
 @app.route('/admin/elections', methods=['GET', 'POST'])
 @login_required
@@ -418,10 +662,11 @@ def admin_elections():
             else:
                 flash('Election not found', 'danger')
                 
-    # Get all elections
-    elections = Election.query.all()
+    # One page of elections, only the columns the table renders
+    q, after, limit = listing_args()
+    page = list_elections(q=q, after=after, limit=limit)
     
-    return render_template('admin/elections.html', elections=elections)
+    return render_template('admin/elections.html', page=page, elections=page['items'], filters={'q': q})
 
 @app.route('/admin/candidates', methods=['GET', 'POST'])
 @login_required
@@ -492,10 +737,11 @@ def admin_candidates():
             else:
                 flash('Candidate not found', 'danger')
                 
-    # Get all candidates
-    candidates = Candidate.query.all()
+    # One page of candidates, only the columns the table renders
+    q, after, limit = listing_args()
+    page = list_candidates(q=q, after=after, limit=limit)
     
-    return render_template('admin/candidates.html', candidates=candidates)
+    return render_template('admin/candidates.html', page=page, candidates=page['items'], filters={'q': q})
 
 @app.route('/admin/voters', methods=['GET', 'POST'])
 @login_required
@@ -515,9 +761,15 @@ def admin_voters():
             if user and not user.is_admin:  # Prevent admin deletion
                 try:
                     # Delete associated votes first
+                    forget_user_votes(user.id)
                     Vote.query.filter_by(user_id=user.id).delete()
                     db.session.delete(user)
                     db.session.commit()
+                    invalidate_user(user.id)
+                    retina_index.remove(user.id)
+                    
+                    if user.retina_scan_digest:
+                        release_scan_blob(user.retina_scan_digest)
                     flash('Voter deleted successfully', 'success')
                 except Exception as e:
                     logging.error(f"Error deleting voter: {str(e)}")
@@ -525,37 +777,166 @@ def admin_voters():
             else:
                 flash('Voter not found or is an admin', 'danger')
                 
-    # Get all registered users
-    users = User.query.all()
+    # One page of voters, without loading retina data
+    q, after, limit = listing_args()
+    registered = flag_arg('registered')
+    page = list_voters(q=q, registered=registered, after=after, limit=limit)
+    filters = {'q': q, 'registered': {True: '1', False: '0'}.get(registered)}
     
-    return render_template('admin/voters.html', users=users)
+    return render_template('admin/voters.html', page=page, voters=page['items'],
+                          admins=list_admins(), filters=filters)
+
+@app.route('/api/admin/voters')
+@login_required
+def api_admin_voters():
+    """
+    JSON listing of voters for admin tooling
+    
+    Query parameters:
+        q: Username or email prefix
+        registered: 1 or 0 to filter on registration status
+        after: Only return voters with a greater id (keyset cursor)
+        limit: Maximum number of voters per page
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    q, after, limit = listing_args()
+    return listing_response(list_voters(q=q, registered=flag_arg('registered'), after=after, limit=limit))
+
+@app.route('/api/admin/candidates')
+@login_required
+def api_admin_candidates():
+    """JSON listing of candidates; takes q (name prefix), after and limit"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    q, after, limit = listing_args()
+    return listing_response(list_candidates(q=q, after=after, limit=limit))
+
+@app.route('/api/admin/elections')
+@login_required
+def api_admin_elections():
+    """JSON listing of elections; takes q (title prefix), active, after and limit"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    q, after, limit = listing_args()
+    return listing_response(list_elections(q=q, active=flag_arg('active'), after=after, limit=limit))
 
 @app.route('/api/blockchain')
 def get_blockchain():
-    """API endpoint to get blockchain data for visualization"""
-    chain = blockchain.chain
-    return jsonify(chain)
-
-# Flag to track if admin creation has run
-admin_created = False
-
-# Initialize admin user if none exists
-@app.before_request
-def create_admin():
-    global admin_created
-    # Only run once by checking the global flag
-    if not admin_created:
-        admin = User.query.filter_by(is_admin=True).first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@example.com',
-                is_admin=True,
-                is_registered=True
-            )
-            admin.set_password('adminpassword')
-            db.session.add(admin)
-            db.session.commit()
-            logging.info("Admin user created")
-        # Set flag to prevent re-running on every request
-        admin_created = True
+    """
+    API endpoint to get blockchain data for visualization
+    
+    Query parameters:
+        after: Only return blocks with a greater index (keyset cursor)
+        limit: Maximum number of blocks per page
+        summary: If set, omit block data and return headers only
+    """
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+    
+    # Pick up blocks sealed by other workers, then key pages by the tip hash
+    blockchain.refresh(max_age=app.config['BLOCKCHAIN_TIP_REFRESH'])
+    tip = blockchain.last_block
+    etag = f"{tip['hash']}-{after}-{limit}-{'s' if summary else 'f'}"
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+        
+    if summary:
+        blocks = blockchain.chain.summaries(after, limit)
+        # Blocks sealed after the tip was read belong to the next ETag
+        blocks = [block for block in blocks if block['index'] <= tip['index']]
+        response = jsonify({
+            'blocks': blocks,
+            'height': tip['index'],
+            'tip_hash': tip['hash'],
+            'next_after': blocks[-1]['index'] if blocks else after,
+            'has_more': bool(blocks) and blocks[-1]['index'] < tip['index']
+        })
+    else:
+        # Splice the blocks' canonical encodings (from the LRU or the chain
+        # log) into the response instead of decoding and re-encoding them
+        encoded = [(index, data) for index, data in blockchain.chain.encoded_page(after, limit)
+                   if index <= tip['index']]
+        envelope = json.dumps({
+            'height': tip['index'],
+            'tip_hash': tip['hash'],
+            'next_after': encoded[-1][0] if encoded else after,
+            'has_more': bool(encoded) and encoded[-1][0] < tip['index']
+        })
+        body = b'{"blocks": [' + b', '.join(data for _, data in encoded) + b'], ' + envelope[1:].encode()
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/receipt/<receipt>')
+def get_receipt(receipt):
+    """API endpoint to check whether a vote receipt is pending or sealed"""
+    status = blockchain.lookup_receipt(receipt)
+    if status is None:
+        return jsonify({'error': 'Unknown receipt'}), 404
+    return jsonify(status)
+
+@app.route('/api/receipt/<receipt>/proof')
+def get_receipt_proof(receipt):
+    """
+    API endpoint returning a Merkle inclusion proof for a sealed vote
+    
+    The proof and block header are enough to check the vote against the
+    chain without downloading the block body.
+    """
+    proof = blockchain.inclusion_proof(receipt)
+    if proof is None:
+        return jsonify({'error': 'No inclusion proof for this receipt'}), 404
+    return jsonify(proof)
+
+@app.route('/api/events')
+def stream_events():
+    """
+    Server-sent events for live results and chain updates
+    
+    Query parameters:
+        election_id: Send 'tally' events with vote deltas for this election
+        blocks: If set, send a 'block' event with the header of each new block
+    """
+    topics = set()
+    if request.args.get('blocks', '').lower() in ('1', 'true', 'yes'):
+        topics.add('blocks')
+    election_id = request.args.get('election_id', type=int)
+    if election_id is not None:
+        election = Election.query.get_or_404(election_id)
+        # Same rule as the results page
+        if election.end_date > datetime.utcnow() and not (current_user.is_authenticated and current_user.is_admin):
+            return jsonify({'error': 'Results are not available yet'}), 403
+        topics.add(f'election:{election_id}')
+    if not topics:
+        return jsonify({'error': 'Nothing to subscribe to'}), 400
+    if not change_watcher.running:
+        return jsonify({'error': 'Live updates are not available'}), 503
+        
+    subscription = broadcaster.subscribe(topics)
+    change_watcher.notify()
+    response = app.response_class(broadcaster.stream(subscription, timeout=app.config['EVENTS_STREAM_TIMEOUT']),
+                                  mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: 200 once this worker has finished its startup phase"""
+    if not readiness.ready:
+        return jsonify({'status': 'starting'}), 503
+    return jsonify({
+        'status': 'ready',
+        'warmed_at': readiness.warmed_at.isoformat(),
+        'retina_scans': scan_service.stats(),
+        **readiness.details
+    })
+
+# Register CLI commands
+import commands  # noqa: E402,F401
@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+STAGES = ('queue', 'preprocess', 'features')
+
+class ServiceBusy(Exception):
+    """Raised when a scan cannot be accepted or finished in time"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ScanProcessingService:
+    """
+    Bounded thread pool that caps how many retina scans are processed at once
+
+    This limits concurrency; it does not make a scan faster or free the
+    request. The request thread still waits for its scan's result, so a
+    WSGI worker stays occupied for the whole decode. What the pool adds is
+    that at most `workers` scans run on OpenCV at a time and at most
+    `workers + max_queue` are admitted; further submissions fail fast with
+    ServiceBusy (a 503) instead of piling up behind each other. Time spent
+    queued, preprocessing and computing features is recorded per scan.
+    """
+
+    def __init__(self, retina_auth, workers=2, max_queue=16, timeout=10.0, retry_after=2):
+        self.retina_auth = retina_auth
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._timings = {stage: [0, 0.0, 0.0] for stage in STAGES}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='retina-scan')
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def extract(self, image_data):
+        """
+        Extract features from a scan on the pool, blocking the caller until
+        the result is ready or `timeout` passes
+
+        Args:
+            image_data: Encoded image as bytes, bytearray or memoryview
+
+        Returns:
+            Feature vector, or None if the image could not be processed
+
+        Raises:
+            ServiceBusy: The queue is full or the scan did not finish in time
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ServiceBusy('Retina scan queue is full', self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._get_pool().submit(self._process, image_data, time.perf_counter())
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # The scan keeps its slot until the worker finishes with it
+            future.cancel()
+            raise ServiceBusy('Retina scan timed out', self.retry_after)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _process(self, image_data, submitted):
+        started = time.perf_counter()
+        processed_image = self.retina_auth.preprocess_retina_image(image_data)
+        preprocessed = time.perf_counter()
+        features = None
+        if processed_image is not None:
+            features = self.retina_auth.features_from_image(processed_image)
+        finished = time.perf_counter()
+
+        self._record(queue=started - submitted,
+                     preprocess=preprocessed - started,
+                     features=finished - preprocessed)
+        logging.debug(f"Retina scan timings: queue={(started - submitted) * 1000:.1f}ms "
+                      f"preprocess={(preprocessed - started) * 1000:.1f}ms "
+                      f"features={(finished - preprocessed) * 1000:.1f}ms")
+        return features
+
+    def _record(self, **durations):
+        with self._lock:
+            for stage, seconds in durations.items():
+                timing = self._timings[stage]
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    def stats(self):
+        """Queue depth, rejections and per-stage mean/max timings in milliseconds"""
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'capacity': self.workers + self.max_queue,
+                'rejected': self._rejected,
+                'stages': {
+                    stage: {
+                        'count': count,
+                        'mean_ms': round(total * 1000 / count, 2) if count else 0.0,
+                        'max_ms': round(longest * 1000, 2)
+                    }
+                    for stage, (count, total, longest) in self._timings.items()
+                }
+            }
@@ -0,0 +1,98 @@
+"""
+Startup upgrade of existing databases
+
+db.create_all() creates missing tables but never alters existing ones, so
+columns and indexes added to a model later would be missing on databases
+created before them. upgrade_schema() adds them: nullable columns with
+ALTER TABLE ... ADD COLUMN and indexes with CREATE INDEX. A missing
+NOT NULL column cannot be added safely and is logged as an error instead.
+
+Every worker runs this at import time, so several may create or upgrade
+the same database at once. Each table, column and index is created in its
+own transaction, and one that fails because another worker made it first
+is skipped.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DatabaseError
+
+from app import db
+
+def create_tables():
+    """
+    db.create_all(), one table at a time so a concurrent worker's tables are skipped
+
+    Must be run inside an app context.
+    """
+    engine = db.engine
+    for table in db.metadata.sorted_tables:
+        try:
+            with engine.begin() as conn:
+                table.create(bind=conn, checkfirst=True)
+        except DatabaseError:
+            if not inspect(engine).has_table(table.name):
+                raise
+
+def _add_column(engine, table, column):
+    """Add one nullable column; False if another worker added it first"""
+    quote = engine.dialect.identifier_preparer.quote
+    column_type = column.type.compile(dialect=engine.dialect)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {quote(table.name)} "
+                              f"ADD COLUMN {quote(column.name)} {column_type}"))
+    except DatabaseError:
+        columns = {c['name'] for c in inspect(engine).get_columns(table.name)}
+        if column.name not in columns:
+            raise
+        return False
+    return True
+
+def _add_index(engine, index):
+    """Create one index; False if another worker created it first"""
+    try:
+        with engine.begin() as conn:
+            # No checkfirst: a worker that lost the race must fail here, or
+            # it would report an index it did not create
+            index.create(bind=conn)
+    except DatabaseError:
+        indexes = {i['name'] for i in inspect(engine).get_indexes(index.table.name)}
+        if index.name not in indexes:
+            raise
+        return False
+    return True
+
+def upgrade_schema():
+    """
+    Add missing nullable columns and missing indexes to existing tables
+
+    Must be run inside an app context, after create_tables().
+
+    Returns:
+        List of the "table.column" and index names that were added
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                logging.error(f"Column {table.name}.{column.name} is missing and NOT NULL; "
+                              f"add it by hand")
+                continue
+            if _add_column(engine, table, column):
+                added.append(f"{table.name}.{column.name}")
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes and _add_index(engine, index):
+                added.append(index.name)
+    for name in added:
+        logging.warning(f"Schema upgraded: added {name}")
+    return added
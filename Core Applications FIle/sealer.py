@@ -0,0 +1,136 @@
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+from models import ChainState
+
+class BlockSealer:
+    """
+    Background worker that mines pending votes into blocks.
+
+    Votes are queued by Blockchain.new_vote and sealed here, so the vote
+    request never waits on proof of work. A block is sealed once enough votes
+    are pending, or once the oldest pending vote has waited max_wait seconds.
+
+    Every web worker may start a sealer thread, but only the one holding the
+    lease on the ChainState row mines; the others idle until it lapses (e.g.
+    because its process died), so the same batch is not mined in parallel.
+    """
+
+    def __init__(self, blockchain, block_size=2, max_wait=5.0, poll_interval=1.0, lease_seconds=30.0):
+        self.blockchain = blockchain
+        self.block_size = block_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.sealer_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.leader = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the sealer thread for the given Flask app (idempotent)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,),
+                                        name='block-sealer', daemon=True)
+        self._thread.start()
+        logging.info("Block sealer started")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def join(self):
+        """Block until the sealer thread exits"""
+        while self.running:
+            self._thread.join(1)
+
+    def notify(self):
+        """Wake the sealer early, e.g. right after a vote is queued"""
+        self._wake.set()
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            sealed = None
+            try:
+                with app.app_context():
+                    if self.acquire_lease():
+                        sealed = self.run_once()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error sealing pending votes: {str(e)}")
+
+            # Keep draining while there is a backlog
+            if sealed is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+        try:
+            with app.app_context():
+                self.release_lease()
+        except Exception as e:
+            logging.error(f"Error releasing the sealer lease: {str(e)}")
+
+    def acquire_lease(self):
+        """
+        Take or renew the sealing lease on the ChainState row
+
+        A single conditional UPDATE, so two workers can never both win it.
+
+        Returns:
+            True if this sealer holds the lease and may mine
+        """
+        now = datetime.utcnow()
+        held = ChainState.query.filter(
+            ChainState.id == 1,
+            db.or_(ChainState.sealer_id.is_(None),
+                   ChainState.sealer_id == self.sealer_id,
+                   ChainState.sealer_lease_until < now)
+        ).update({ChainState.sealer_id: self.sealer_id,
+                  ChainState.sealer_lease_until: now + timedelta(seconds=self.lease_seconds)},
+                 synchronize_session=False)
+        db.session.commit()
+        if bool(held) != self.leader:
+            logging.info(f"Sealer {self.sealer_id} {'took' if held else 'lost'} the sealing lease")
+        self.leader = bool(held)
+        return self.leader
+
+    def release_lease(self):
+        """Give up the lease so another worker's sealer can take over at once"""
+        ChainState.query.filter_by(id=1, sealer_id=self.sealer_id) \
+            .update({ChainState.sealer_id: None, ChainState.sealer_lease_until: None},
+                    synchronize_session=False)
+        db.session.commit()
+        self.leader = False
+
+    def run_once(self, force=False):
+        """
+        Seal at most one block if the pending queue is due
+
+        Args:
+            force: Seal whatever is pending regardless of size or age
+
+        Returns:
+            The sealed block, or None if nothing was sealed
+        """
+        count, oldest = self.blockchain.pending_stats()
+        if not count:
+            return None
+
+        waited = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+        if force or count >= self.block_size or waited >= self.max_wait:
+            return self.blockchain.seal_pending(max_votes=self.block_size)
+        return None
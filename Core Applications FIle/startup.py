@@ -0,0 +1,115 @@
+import logging
+import time
+from datetime import datetime
+
+import click
+
+from app import db
+from models import Election, User
+
+class Readiness:
+    """Tracks whether this worker has finished its startup phase"""
+
+    def __init__(self):
+        self.ready = False
+        self.warmed_at = None
+        self.details = {}
+
+    def mark_ready(self, **details):
+        self.details = details
+        self.warmed_at = datetime.utcnow()
+        self.ready = True
+
+readiness = Readiness()
+
+def ensure_admin():
+    """Create the default admin user if no admin exists"""
+    if User.query.filter_by(is_admin=True).first():
+        return
+    admin = User(
+        username='admin',
+        email='admin@example.com',
+        is_admin=True,
+        is_registered=True
+    )
+    admin.set_password('adminpassword')
+    db.session.add(admin)
+    db.session.commit()
+    logging.info("Admin user created")
+
+def bootstrap(app, start_workers=True):
+    """
+    Warm this worker once, before it accepts traffic
+    
+    Loads the chain state, ensures the admin user exists, builds the retina
+    index, backfills the tallies of databases that predate them and primes
+    the tallies of active elections. Afterwards the vote writer, the live
+    update watcher and the dashboard snapshot refresher are started, and the
+    background sealer if it runs in-process.
+    
+    Args:
+        app: Flask application
+        start_workers: Whether to start background threads such as the sealer
+        
+    Returns:
+        True if the worker is ready to serve
+    """
+    from routes import (blockchain, change_watcher, dashboard, ensure_retina_index, retina_index,
+                        sealer, vote_writer)
+    from tally import backfill_tallies, get_tally
+    
+    with app.app_context():
+        blockchain.initialize()
+        if not blockchain.initialized:
+            logging.error("Startup failed: blockchain could not be loaded")
+            return False
+            
+        ensure_admin()
+        ensure_retina_index()
+        backfill_tallies()
+        active_elections = Election.query.filter_by(is_active=True).all()
+        for election in active_elections:
+            get_tally(election.id)
+            
+        chain_height = blockchain.last_block['index']
+        
+    if start_workers:
+        vote_writer.start(app)
+        change_watcher.start(app)
+        dashboard.start(app)
+        if app.config['BLOCKCHAIN_SEALER_IN_PROCESS']:
+            sealer.start(app)
+        
+    readiness.mark_ready(chain_height=chain_height,
+                         enrolled_retinas=len(retina_index),
+                         active_elections=len(active_elections))
+    logging.info(f"Worker ready: {readiness.details}")
+    return True
+
+def serving_process():
+    """
+    Whether this process serves requests
+    
+    False while the app is loaded for a `flask` CLI command other than
+    `flask run`; such processes must not start background threads.
+    """
+    ctx = click.get_current_context(silent=True)
+    return ctx is None or ctx.command.name == 'run'
+
+def bootstrap_with_retries(app, start_workers=True, attempts=5, delay=1.0):
+    """
+    Run bootstrap() until it succeeds, backing off between attempts
+    
+    Returns:
+        True once the worker is ready, False if every attempt failed
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            if bootstrap(app, start_workers=start_workers):
+                return True
+        except Exception as e:
+            logging.error(f"Startup attempt {attempt} failed: {str(e)}")
+        if attempt < attempts:
+            time.sleep(delay)
+            delay *= 2
+    return False
@@ -0,0 +1,143 @@
+import json
+import logging
+from collections import Counter
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from cache import TTLCache
+from models import PendingVote, Vote, VoteTally
+
+# Per-election (counts, total) read from VoteTally, shared by results and dashboard
+results_cache = TTLCache(ttl=app.config['RESULTS_CACHE_TTL'])
+
+def build_results(candidates, counts):
+    """Pair candidates with their vote counts, sorted by votes (descending)"""
+    results = [{
+        'candidate': candidate,
+        'votes': counts.get(candidate.id, 0)
+    } for candidate in candidates]
+    results.sort(key=lambda x: x['votes'], reverse=True)
+    return results
+
+def record_vote(election_id, candidate_id, count=1):
+    """
+    Increment the materialized tally for `count` votes
+    
+    The change is staged in the current session so it commits in the same
+    transaction as the Vote rows.
+    """
+    query = VoteTally.query.filter_by(election_id=election_id, candidate_id=candidate_id)
+    if query.update({VoteTally.votes: VoteTally.votes + count}, synchronize_session=False):
+        return
+        
+    # First vote for this candidate; another worker may be inserting the row too
+    try:
+        with db.session.begin_nested():
+            db.session.add(VoteTally(election_id=election_id, candidate_id=candidate_id, votes=count))
+    except IntegrityError:
+        query.update({VoteTally.votes: VoteTally.votes + count}, synchronize_session=False)
+
+def forget_user_votes(user_id):
+    """
+    Take a user's votes out of the materialized tallies before they are deleted
+    
+    Staged in the current session, like record_vote.
+    """
+    rows = db.session.query(Vote.election_id, Vote.candidate_id, db.func.count(Vote.id)) \
+        .filter(Vote.user_id == user_id) \
+        .group_by(Vote.election_id, Vote.candidate_id).all()
+    for election_id, candidate_id, count in rows:
+        VoteTally.query.filter_by(election_id=election_id, candidate_id=candidate_id) \
+            .update({VoteTally.votes: VoteTally.votes - count}, synchronize_session=False)
+        results_cache.invalidate(election_id)
+
+def read_tally(election_id):
+    """
+    Read an election's counts from the materialized tally table
+    
+    Returns:
+        Tuple of (dict of candidate_id -> vote count, total votes)
+    """
+    rows = db.session.query(VoteTally.candidate_id, VoteTally.votes) \
+        .filter(VoteTally.election_id == election_id).all()
+    counts = {candidate_id: votes for candidate_id, votes in rows}
+    return counts, sum(counts.values())
+
+def get_tally(election_id):
+    """Cached read_tally(); entries expire after RESULTS_CACHE_TTL seconds"""
+    return results_cache.get_or_set(election_id, lambda: read_tally(election_id))
+
+def invalidate_tally(election_id):
+    results_cache.invalidate(election_id)
+
+def counts_from_votes(election_id=None):
+    """Recount Vote rows as {(election_id, candidate_id): votes}"""
+    query = db.session.query(Vote.election_id, Vote.candidate_id, db.func.count(Vote.id))
+    if election_id is not None:
+        query = query.filter(Vote.election_id == election_id)
+    rows = query.group_by(Vote.election_id, Vote.candidate_id).all()
+    return {(e_id, c_id): count for e_id, c_id, count in rows}
+
+def counts_from_blocks(blocks, election_id=None):
+    """
+    Recount the votes recorded in block data as {(election_id, candidate_id): votes}
+    
+    Args:
+        blocks: Iterable of block dicts, or Block rows whose data is still JSON text
+        election_id: Only count votes of this election
+    """
+    counts = Counter()
+    for block in blocks:
+        data = block['data'] if isinstance(block, dict) else json.loads(block.data)
+        for vote in data:
+            if election_id is None or vote.get('election_id') == election_id:
+                counts[(vote['election_id'], vote['candidate_id'])] += 1
+    return dict(counts)
+
+def counts_from_pending(election_id=None):
+    """Count the votes still waiting in the PendingVote queue, like counts_from_blocks"""
+    rows = PendingVote.query.with_entities(PendingVote.data).filter_by(status='pending').all()
+    return counts_from_blocks([{'data': [json.loads(row.data) for row in rows]}], election_id)
+
+def backfill_tallies():
+    """
+    Fill an empty tally table from the Vote rows
+    
+    Databases created before the tally table existed have votes but no
+    tallies, and the results pages read only the tallies.
+    
+    Returns:
+        Number of tally rows written
+    """
+    if db.session.query(VoteTally.id).first() is not None or db.session.query(Vote.id).first() is None:
+        return 0
+    counts = counts_from_votes()
+    try:
+        rebuild_tallies(counts)
+    except IntegrityError:
+        # Another worker backfilled first
+        db.session.rollback()
+        return 0
+    logging.warning(f"Backfilled {len(counts)} tally row(s) from existing votes")
+    return len(counts)
+
+def rebuild_tallies(counts, election_id=None):
+    """
+    Replace the materialized tallies with freshly computed counts
+    
+    Args:
+        counts: Dict of (election_id, candidate_id) -> votes
+        election_id: Only rebuild this election; otherwise rebuild all of them
+    """
+    query = VoteTally.query
+    if election_id is not None:
+        query = query.filter_by(election_id=election_id)
+    query.delete(synchronize_session=False)
+    
+    db.session.add_all(
+        VoteTally(election_id=e_id, candidate_id=c_id, votes=votes)
+        for (e_id, c_id), votes in counts.items()
+    )
+    db.session.commit()
+    results_cache.clear()
@@ -0,0 +1,180 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from app import db
+from models import Vote
+from tally import invalidate_tally, record_vote
+
+class VoteRejected(Exception):
+    """Raised for a vote that must not be recorded, e.g. a second vote by the same user"""
+
+class _Submission:
+    def __init__(self, vote_data):
+        self.vote_data = vote_data
+        self.receipt = None
+        self.error = None
+        self.done = threading.Event()
+
+class VoteWriter:
+    """
+    Group-commit writer for votes
+
+    Request threads hand their vote to submit() and wait. A committer thread
+    collects the votes arriving within `max_wait` seconds (up to `max_batch`)
+    and writes every Vote, PendingVote and tally increment of the batch in
+    one transaction, so concurrent voters share a single commit and fsync.
+    The block that later seals the votes is written by the sealer in one
+    transaction with the votes' blockchain_hash.
+    """
+
+    def __init__(self, blockchain, sealer=None, max_batch=64, max_wait=0.005, timeout=10.0):
+        self.blockchain = blockchain
+        self.sealer = sealer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        # Called with the accepted submissions after each commit
+        self.listeners = []
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the committer thread for the given Flask app (idempotent)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(app,),
+                                        name='vote-writer', daemon=True)
+        self._thread.start()
+        logging.info("Vote writer started")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, vote_data):
+        """
+        Record a vote and return its receipt once it is committed
+
+        Without a running committer thread (e.g. from the CLI) the vote is
+        committed directly in the caller's session.
+
+        Raises:
+            VoteRejected: The user already voted in this election
+            TimeoutError: The vote was not confirmed within `timeout` seconds
+        """
+        submission = _Submission(vote_data)
+        if not self.running:
+            self.commit_batch([submission])
+        else:
+            self._queue.put(submission)
+            if not submission.done.wait(self.timeout):
+                raise TimeoutError('Vote was not confirmed in time')
+
+        if submission.error is not None:
+            raise submission.error
+        return submission.receipt
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            # Hold the batch open briefly so concurrent voters share the commit
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with app.app_context():
+                    self.commit_batch(batch)
+            except Exception as e:
+                logging.error(f"Error committing votes: {str(e)}")
+                for submission in batch:
+                    if not submission.done.is_set():
+                        submission.error = e
+                        submission.done.set()
+
+    def commit_batch(self, batch):
+        """
+        Write a batch of votes in one transaction
+
+        If the transaction fails, the votes are retried one at a time so a
+        single bad vote does not fail the rest of the batch.
+        """
+        try:
+            accepted = self._stage(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) > 1:
+                logging.warning(f"Batch of {len(batch)} votes failed, retrying individually: {str(e)}")
+                for submission in batch:
+                    self.commit_batch([submission])
+                return
+            batch[0].receipt = None
+            batch[0].error = e
+            batch[0].done.set()
+            return
+
+        for election_id in {s.vote_data['election_id'] for s in accepted}:
+            invalidate_tally(election_id)
+        if accepted and self.sealer is not None:
+            self.sealer.notify()
+        if accepted:
+            for listener in self.listeners:
+                listener(accepted)
+        if len(batch) > 1:
+            logging.debug(f"Committed {len(accepted)} votes in one transaction")
+        for submission in batch:
+            submission.done.set()
+
+    def _stage(self, batch):
+        # Reject users who already voted, in the database or earlier in this batch
+        keys = {(s.vote_data['user_id'], s.vote_data['election_id']) for s in batch}
+        voted = set(db.session.query(Vote.user_id, Vote.election_id).filter(
+            db.tuple_(Vote.user_id, Vote.election_id).in_(keys)).all())
+
+        accepted = []
+        tallies = Counter()
+        for submission in batch:
+            data = submission.vote_data
+            submission.receipt, submission.error = None, None
+            key = (data['user_id'], data['election_id'])
+            if key in voted:
+                submission.error = VoteRejected('You have already voted in this election')
+                continue
+            voted.add(key)
+
+            # Queue for the blockchain; blockchain_hash is set once sealed
+            submission.receipt = self.blockchain.new_vote(data)
+            db.session.add(Vote(
+                user_id=data['user_id'],
+                candidate_id=data['candidate_id'],
+                election_id=data['election_id'],
+                receipt=submission.receipt
+            ))
+            tallies[(data['election_id'], data['candidate_id'])] += 1
+            accepted.append(submission)
+
+        for (election_id, candidate_id), count in tallies.items():
+            record_vote(election_id, candidate_id, count)
+        return accepted
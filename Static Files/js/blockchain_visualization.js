@@ -5,20 +5,64 @@ class BlockchainVisualizer {
     constructor(containerId) {
         this.container = document.getElementById(containerId);
         this.blockchain = [];
+        // Delta sync state: index of the last block held and ETag of the last page
+        this.lastIndex = 0;
+        this.etag = null;
+        this.pageSize = 100;
+        this.events = null;
     }
     
     /**
-     * Fetch blockchain data from the server
+     * Fetch new blocks as the server announces them instead of polling
+     */
+    subscribe() {
+        if (this.events || !window.EventSource) {
+            return;
+        }
+        this.events = new EventSource('/api/events?blocks=1');
+        this.events.addEventListener('block', () => this.fetchBlockchain());
+    }
+    
+    unsubscribe() {
+        if (this.events) {
+            this.events.close();
+            this.events = null;
+        }
+    }
+    
+    /**
+     * Fetch blocks the visualizer has not seen yet from the server
      */
     async fetchBlockchain() {
         try {
-            const response = await fetch('/api/blockchain');
-            if (!response.ok) {
-                throw new Error(`HTTP error! Status: ${response.status}`);
+            let changed = false;
+            let hasMore = true;
+            
+            while (hasMore) {
+                const headers = this.etag ? { 'If-None-Match': this.etag } : {};
+                const response = await fetch(`/api/blockchain?after=${this.lastIndex}&limit=${this.pageSize}`, { headers });
+                
+                // Nothing new since the last sync
+                if (response.status === 304) {
+                    break;
+                }
+                if (!response.ok) {
+                    throw new Error(`HTTP error! Status: ${response.status}`);
+                }
+                
+                const page = await response.json();
+                if (page.blocks.length > 0) {
+                    this.blockchain = this.blockchain.concat(page.blocks);
+                    this.lastIndex = page.next_after;
+                    changed = true;
+                }
+                this.etag = response.headers.get('ETag');
+                hasMore = page.has_more;
             }
             
-            this.blockchain = await response.json();
-            this.render();
+            if (changed || this.blockchain.length === 0) {
+                this.render();
+            }
         } catch (error) {
             console.error('Error fetching blockchain:', error);
             this.renderError(error.message);
@@ -62,6 +106,7 @@ class BlockchainVisualizer {
                                 <p><strong>Hash:</strong><br><code class="small">${block.hash}</code></p>
                                 <p><strong>Previous Hash:</strong><br><code class="small">${block.previous_hash}</code></p>
                                 <p><strong>Nonce:</strong> ${block.nonce}</p>
+                                ${block.merkle_root ? `<p><strong>Merkle Root:</strong><br><code class="small">${block.merkle_root}</code></p>` : ''}
                             </div>
                             <div class="col-md-6">
                                 <p><strong>Data:</strong></p>
@@ -80,6 +125,94 @@ class BlockchainVisualizer {
         this.container.innerHTML = html;
     }
     
+    /**
+     * Encode a value the way Python's json.dumps(value, sort_keys=True) does,
+     * so hashes computed by the server can be recomputed here
+     * @param {*} value - Value parsed from the API
+     * @param {Set<string>} floatKeys - Object keys whose numbers are Python floats
+     * @returns {string} Python-compatible JSON text
+     */
+    static pythonJson(value, floatKeys = new Set()) {
+        if (value === null) {
+            return 'null';
+        }
+        if (Array.isArray(value)) {
+            return `[${value.map(item => BlockchainVisualizer.pythonJson(item, floatKeys)).join(', ')}]`;
+        }
+        if (typeof value === 'object') {
+            const keys = Object.keys(value).sort();
+            return `{${keys.map(key => {
+                const item = floatKeys.has(key) && typeof value[key] === 'number'
+                    ? BlockchainVisualizer.pythonFloat(value[key])
+                    : BlockchainVisualizer.pythonJson(value[key], floatKeys);
+                return `${BlockchainVisualizer.pythonJson(key)}: ${item}`;
+            }).join(', ')}}`;
+        }
+        if (typeof value === 'string') {
+            // ensure_ascii: everything outside printable ASCII is \u-escaped
+            const escapes = { '"': '\\"', '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b', '\f': '\\f' };
+            return `"${value.replace(/["\\\u0000-\u001f\u007f-\uffff]/g, char =>
+                escapes[char] || `\\u${char.charCodeAt(0).toString(16).padStart(4, '0')}`)}"`;
+        }
+        return String(value);
+    }
+    
+    /**
+     * Python's repr of a float for the magnitudes used in block headers:
+     * JSON.parse drops the ".0" of integral floats, which Python keeps
+     * @param {number} value - Float value
+     * @returns {string} Python float text
+     */
+    static pythonFloat(value) {
+        return Number.isInteger(value) && Math.abs(value) < 1e16 ? `${value}.0` : String(value);
+    }
+    
+    /**
+     * Fetch the inclusion proof for a vote receipt and check it end to end
+     * without downloading the block body: the vote's leaf is recomputed
+     * here, the proof must lead from it to the block's Merkle root, and the
+     * block header must hash to the block's hash (see mining.block_preimage)
+     * @param {string} receipt - Vote receipt
+     * @returns {Promise<boolean>} Whether the vote is committed to by the block hash
+     */
+    async verifyReceipt(receipt) {
+        const response = await fetch(`/api/receipt/${encodeURIComponent(receipt)}/proof`);
+        if (!response.ok) {
+            return false;
+        }
+        const result = await response.json();
+        
+        const toBytes = hex => new Uint8Array(hex.match(/../g).map(byte => parseInt(byte, 16)));
+        const toHex = bytes => Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+        const sha256 = async bytes => new Uint8Array(await crypto.subtle.digest('SHA-256', bytes));
+        const encoder = new TextEncoder();
+        
+        // The block hash must cover the header, which carries the Merkle root
+        const { hash, ...header } = result.block;
+        const headerJson = BlockchainVisualizer.pythonJson(header, new Set(['timestamp']));
+        if (toHex(await sha256(encoder.encode(headerJson))) !== hash) {
+            return false;
+        }
+        
+        // Leaves are sha256(0x00 || canonical vote JSON), as in merkle.py
+        const voteJson = encoder.encode(BlockchainVisualizer.pythonJson(result.vote));
+        const leaf = new Uint8Array(1 + voteJson.length);
+        leaf.set(voteJson, 1);
+        
+        // Inner nodes are sha256(0x01 || left || right)
+        let current = await sha256(leaf);
+        for (const step of result.proof) {
+            const sibling = toBytes(step.hash);
+            const [left, right] = step.side === 'left' ? [sibling, current] : [current, sibling];
+            const node = new Uint8Array(1 + left.length + right.length);
+            node[0] = 1;
+            node.set(left, 1);
+            node.set(right, 1 + left.length);
+            current = await sha256(node);
+        }
+        return toHex(current) === result.block.merkle_root;
+    }
+    
     /**
      * Render transactions within a block
      * @param {Array} transactions - Transaction data
@@ -143,8 +276,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (container.style.display === 'none') {
                 container.style.display = 'block';
                 visualizer.fetchBlockchain();
+                visualizer.subscribe();
             } else {
                 container.style.display = 'none';
+                visualizer.unsubscribe();
             }
         });
     }
@@ -1,12 +1,16 @@
 /**
  * Camera access and processing for retinal scanning
+ * @param {Object} options - Optional settings
+ * @param {number} options.captureSize - Square side length to capture at;
+ *     defaults to the form's data-capture-size, or the full video frame
  */
-const setupCamera = async () => {
+const setupCamera = async (options = {}) => {
     const video = document.getElementById('video');
     const canvas = document.getElementById('canvas');
     const captureBtn = document.getElementById('capture-btn');
     const submitBtn = document.getElementById('submit-btn');
     const imageDataInput = document.getElementById('image_data');
+    const scanForm = document.getElementById('scan-form');
     
     if (!video || !canvas || !captureBtn || !submitBtn || !imageDataInput) {
         console.error('Required elements not found');
@@ -14,6 +18,11 @@ const setupCamera = async () => {
     }
     
     let stream = null;
+    let scanBlob = null;
+    
+    // Capture at the server's working size instead of the full video frame
+    const captureSize = options.captureSize ||
+        (scanForm && parseInt(scanForm.dataset.captureSize, 10)) || 0;
     
     try {
         // Request camera with specific constraints
@@ -32,9 +41,9 @@ const setupCamera = async () => {
         
         // Capture button click handler
         captureBtn.addEventListener('click', () => {
-            // Set canvas dimensions to match video
-            canvas.width = video.videoWidth;
-            canvas.height = video.videoHeight;
+            // Set canvas dimensions to the capture size or the video
+            canvas.width = captureSize || video.videoWidth;
+            canvas.height = captureSize || video.videoHeight;
             
             const context = canvas.getContext('2d');
             
@@ -44,12 +53,17 @@ const setupCamera = async () => {
             // Apply image processing to enhance retina features
             enhanceRetinalImage(context, canvas.width, canvas.height);
             
-            // Convert to base64 and set form value
-            const dataUrl = canvas.toDataURL('image/jpeg', 0.8);
-            imageDataInput.value = dataUrl;
-            
-            // Enable submit button
-            submitBtn.disabled = false;
+            // Encode as a JPEG blob for the binary upload endpoint,
+            // falling back to the base64 form field without canvas.toBlob
+            if (canvas.toBlob && scanForm && scanForm.dataset.uploadUrl) {
+                canvas.toBlob((blob) => {
+                    scanBlob = blob;
+                    submitBtn.disabled = false;
+                }, 'image/jpeg', 0.8);
+            } else {
+                imageDataInput.value = canvas.toDataURL('image/jpeg', 0.8);
+                submitBtn.disabled = false;
+            }
             
             // Visual feedback - flash green border
             video.style.border = '2px solid #28a745';
@@ -58,6 +72,20 @@ const setupCamera = async () => {
             }, 300);
         });
         
+        // Upload the captured scan as raw bytes
+        if (scanForm) {
+            scanForm.addEventListener('submit', (event) => {
+                if (!scanBlob) {
+                    return;
+                }
+                event.preventDefault();
+                submitBtn.disabled = true;
+                uploadScan(scanForm.dataset.uploadUrl, scanBlob).finally(() => {
+                    submitBtn.disabled = false;
+                });
+            });
+        }
+        
         // Clean up on page unload
         window.addEventListener('beforeunload', () => {
             if (stream) {
@@ -78,6 +106,37 @@ const setupCamera = async () => {
     }
 };
 
+/**
+ * POST an encoded scan to a binary upload endpoint and follow its redirect
+ * @param {string} url - Upload endpoint
+ * @param {Blob} blob - JPEG-encoded scan
+ */
+const uploadScan = async (url, blob) => {
+    const message = document.getElementById('scan-message');
+    try {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': blob.type || 'image/jpeg', 'Accept': 'application/json' },
+            body: blob
+        });
+        const result = await response.json();
+        if (result.redirect) {
+            window.location.href = result.redirect;
+            return;
+        }
+        if (message) {
+            message.textContent = result.message;
+            message.classList.remove('d-none');
+        }
+    } catch (err) {
+        console.error('Error uploading scan:', err);
+        if (message) {
+            message.textContent = 'Error uploading retina scan. Please try again.';
+            message.classList.remove('d-none');
+        }
+    }
+};
+
 /**
  * Apply image processing to enhance retinal features
  * @param {CanvasRenderingContext2D} context - Canvas context
@@ -107,4 +166,4 @@ const enhanceRetinalImage = (context, width, height) => {
 };
 
 // Initialize camera when page loads
-document.addEventListener('DOMContentLoaded', setupCamera);
+document.addEventListener('DOMContentLoaded', () => setupCamera());
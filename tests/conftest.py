@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# app.py reads its configuration and creates the tables at import time, so
+# point it at a scratch database before anything imports it
+DATA_DIR = tempfile.mkdtemp(prefix='retinal-voting-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DATA_DIR, 'test.db')
+os.environ['RETINA_BLOB_DIR'] = os.path.join(DATA_DIR, 'retina_blobs')
+os.environ['BLOCKCHAIN_SEALER_IN_PROCESS'] = '0'
+os.environ['BLOCKCHAIN_DIFFICULTY'] = '2'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'Core Applications FIle'))
+
+from app import app as flask_app, db  # noqa: E402
+from schema import create_tables  # noqa: E402
+
+# Low enough that sealing a block takes milliseconds
+TEST_DIFFICULTY = 2
+
+@pytest.fixture
+def app():
+    """The Flask app inside an app context, on freshly created tables"""
+    with flask_app.app_context():
+        db.drop_all()
+        create_tables()
+        yield flask_app
+        db.session.remove()
+
+@pytest.fixture
+def blockchain(app):
+    """Blockchain with its genesis block, mining at TEST_DIFFICULTY"""
+    from blockchain import Blockchain
+    chain = Blockchain(difficulty=TEST_DIFFICULTY)
+    chain.initialize()
+    assert chain.initialized
+    return chain
+
+@pytest.fixture
+def set_timezone():
+    """Switch the process timezone (e.g. 'Asia/Tokyo'); restored afterwards"""
+    original = os.environ.get('TZ')
+
+    def set_tz(name):
+        os.environ['TZ'] = name
+        time.tzset()
+
+    yield set_tz
+    if original is None:
+        os.environ.pop('TZ', None)
+    else:
+        os.environ['TZ'] = original
+    time.tzset()
+
+def stage_votes(blockchain, count, election_id=1):
+    """Queue `count` votes by distinct users and commit them; returns the receipts"""
+    receipts = [blockchain.new_vote({'user_id': user_id, 'candidate_id': 1 + user_id % 2,
+                                     'election_id': election_id})
+                for user_id in range(1, count + 1)]
+    db.session.commit()
+    return receipts
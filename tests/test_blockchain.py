@@ -0,0 +1,148 @@
+from app import db
+from audit import ChainAuditor
+from blockchain import Blockchain
+from conftest import TEST_DIFFICULTY, stage_votes
+from mining import LEGACY_DIFFICULTY, block_datetime, block_timestamp, hash_block
+from models import Block
+
+def reload_chain(difficulty=TEST_DIFFICULTY):
+    """A new process's view of the persisted chain"""
+    chain = Blockchain(difficulty=difficulty)
+    chain.initialize()
+    return chain
+
+def seal_all(blockchain, max_votes=2):
+    blocks = []
+    while True:
+        block = blockchain.seal_pending(max_votes=max_votes)
+        if block is None:
+            return blocks
+        blocks.append(block)
+
+def test_genesis_block(blockchain):
+    assert len(blockchain.chain) == 1
+    genesis = blockchain.last_block
+    assert genesis['index'] == 1
+    assert genesis['previous_hash'] == '1'
+    assert genesis['hash'] == hash_block(genesis)
+    assert blockchain.is_valid_chain(full=True)
+
+def test_sealed_blocks_link_and_validate(blockchain):
+    stage_votes(blockchain, 5)
+    blocks = seal_all(blockchain)
+
+    assert [len(block['data']) for block in blocks] == [2, 2, 1]
+    for previous, block in zip([blockchain.chain.get(1)] + blocks, blocks):
+        assert block['previous_hash'] == previous['hash']
+        assert block['hash'] == hash_block(block)
+        assert Blockchain.valid_proof(previous['nonce'], block['nonce'], previous['hash'],
+                                      TEST_DIFFICULTY)
+    assert blockchain.is_valid_chain(full=True)
+    assert reload_chain().is_valid_chain(full=True)
+
+def test_seal_pending_with_nothing_pending(blockchain):
+    assert blockchain.seal_pending() is None
+    assert len(blockchain.chain) == 1
+
+def test_block_hash_excludes_votes_once_merkle_rooted():
+    block = {'index': 2, 'timestamp': 1700000000.5, 'data': [{'user_id': 1}],
+             'merkle_root': 'ab', 'previous_hash': 'cd', 'nonce': 7, 'difficulty': 2}
+    assert hash_block(block) == hash_block(dict(block, data=[], hash='ignored'))
+    assert hash_block(block) != hash_block(dict(block, nonce=8))
+
+def test_tampered_header_is_detected(blockchain):
+    stage_votes(blockchain, 2)
+    block = blockchain.seal_pending()
+    Block.query.filter_by(id=block['index']).update({Block.nonce: block['nonce'] + 1})
+    blockchain.chain.load()
+    assert not blockchain.is_valid_chain(full=True)
+
+def test_tampered_votes_are_detected(blockchain):
+    stage_votes(blockchain, 2)
+    block = blockchain.seal_pending()
+    Block.query.filter_by(id=block['index']).update({Block.data: '[]'})
+    assert not reload_chain().is_valid_chain(full=True)
+
+def test_block_timestamp_round_trip(set_timezone):
+    timestamp = 1700000000.123456
+    for zone in ('UTC', 'Asia/Tokyo', 'America/New_York'):
+        set_timezone(zone)
+        assert block_datetime(timestamp).isoformat() == '2023-11-14T22:13:20.123456'
+        assert block_timestamp(block_datetime(timestamp)) == timestamp
+
+def test_chain_validates_in_another_timezone(blockchain, set_timezone):
+    set_timezone('Asia/Tokyo')
+    stage_votes(blockchain, 4)
+    sealed = seal_all(blockchain)
+    assert blockchain.is_valid_chain(full=True)
+
+    set_timezone('America/New_York')
+    chain = reload_chain()
+    assert chain.is_valid_chain(full=True)
+    assert chain.last_block['hash'] == sealed[-1]['hash']
+    assert chain.last_block['timestamp'] == sealed[-1]['timestamp']
+
+def test_chain_stays_valid_after_difficulty_change(blockchain):
+    stage_votes(blockchain, 4)
+    seal_all(blockchain)
+    assert reload_chain(difficulty=5).is_valid_chain(full=True)
+
+def test_chain_mixing_difficulties_is_valid(blockchain):
+    stage_votes(blockchain, 2)
+    seal_all(blockchain)
+    harder = reload_chain(difficulty=3)
+    stage_votes(harder, 2, election_id=2)
+    block = harder.seal_pending()
+    assert block['difficulty'] == 3
+    assert db.session.get(Block, block['index']).difficulty == 3
+    assert reload_chain().is_valid_chain(full=True)
+
+def test_tampered_difficulty_is_detected(blockchain):
+    stage_votes(blockchain, 2)
+    block = blockchain.seal_pending()
+    Block.query.filter_by(id=block['index']).update({Block.difficulty: 6})
+    assert not reload_chain().is_valid_chain(full=True)
+
+def test_blocks_without_recorded_difficulty_use_legacy_difficulty(app, monkeypatch):
+    chain = Blockchain(difficulty=LEGACY_DIFFICULTY)
+    build_block = chain._build_block
+
+    def build_unrecorded(*args, **kwargs):
+        # Shape of a block sealed before difficulties were recorded
+        block = build_block(*args, **kwargs)
+        del block['difficulty'], block['hash']
+        block['hash'] = hash_block(block)
+        return block
+
+    monkeypatch.setattr(chain, '_build_block', build_unrecorded)
+    chain.initialize()
+    stage_votes(chain, 2)
+    block = chain.seal_pending()
+    assert db.session.get(Block, block['index']).difficulty is None
+    assert reload_chain(difficulty=5).is_valid_chain(full=True)
+
+def test_audit_checks_each_block_at_its_difficulty(blockchain):
+    stage_votes(blockchain, 2)
+    seal_all(blockchain)
+    harder = reload_chain(difficulty=3)
+    stage_votes(harder, 2, election_id=2)
+    harder.seal_pending()
+
+    report = ChainAuditor(workers=1, chunk_size=2).run()
+    assert report['ok'], report['errors']
+    assert report['blocks'] == 3
+
+    Block.query.filter_by(id=3).update({Block.difficulty: 2})
+    db.session.commit()
+    report = ChainAuditor(workers=1, chunk_size=2).run()
+    assert not report['ok']
+
+def test_audit_in_another_timezone(blockchain, set_timezone):
+    set_timezone('Asia/Tokyo')
+    stage_votes(blockchain, 4)
+    seal_all(blockchain)
+
+    set_timezone('America/New_York')
+    report = ChainAuditor(workers=1).run()
+    assert report['ok'], report['errors']
+    assert report['chain_votes'] == 4
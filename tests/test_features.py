@@ -0,0 +1,46 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from retina_authentication import (FEATURE_HEADER, FEATURE_LENGTH, FEATURE_MAGIC, FEATURE_VERSION,
+                                   RetinalAuthentication, is_legacy_feature_blob)
+
+@pytest.fixture
+def retina_auth():
+    return RetinalAuthentication()
+
+def test_round_trip(retina_auth):
+    features = np.random.default_rng(0).random(FEATURE_LENGTH).astype(np.float32)
+    blob = retina_auth.serialize_features(features)
+
+    assert len(blob) == FEATURE_HEADER.size + 4 * FEATURE_LENGTH
+    assert FEATURE_HEADER.unpack_from(blob) == (FEATURE_MAGIC, FEATURE_VERSION, 1, FEATURE_LENGTH)
+    assert not is_legacy_feature_blob(blob)
+    restored = retina_auth.deserialize_features(blob)
+    assert restored.dtype == np.float32
+    np.testing.assert_array_equal(restored, features)
+
+def test_float64_features_are_stored_as_float32(retina_auth):
+    features = np.linspace(0, 1, FEATURE_LENGTH)
+    restored = retina_auth.deserialize_features(retina_auth.serialize_features(features))
+    np.testing.assert_allclose(restored, features, rtol=1e-6)
+
+def test_legacy_pickle_blob_is_still_read(retina_auth):
+    features = np.linspace(0, 1, FEATURE_LENGTH)
+    blob = pickle.dumps(features)
+
+    assert is_legacy_feature_blob(blob)
+    np.testing.assert_array_equal(retina_auth.deserialize_features(blob), features)
+    # Migrating a legacy blob rewrites it in the binary format
+    assert not is_legacy_feature_blob(retina_auth.serialize_features(retina_auth.deserialize_features(blob)))
+
+def test_legacy_blob_with_other_types_is_refused(retina_auth):
+    with pytest.raises(pickle.UnpicklingError):
+        retina_auth.deserialize_features(pickle.dumps(os.getcwd))
+
+def test_unknown_format_version_is_refused(retina_auth):
+    blob = retina_auth.serialize_features(np.zeros(FEATURE_LENGTH))
+    with pytest.raises(ValueError):
+        retina_auth.deserialize_features(blob[:2] + bytes([FEATURE_VERSION + 1]) + blob[3:])
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from app import db
+from listing import keyset_page, list_candidates, list_voters
+from models import Candidate, Election, User
+
+def add_user(username, is_admin=False, is_registered=True, **columns):
+    user = User(username=username, email=f'{username}@example.com', is_admin=is_admin,
+                is_registered=is_registered, **columns)
+    db.session.add(user)
+    return user
+
+def test_pages_cover_every_row_once(app):
+    for i in range(23):
+        add_user(f'voter{i:02d}')
+    db.session.commit()
+
+    seen, after, pages = [], 0, 0
+    while True:
+        page = list_voters(after=after, limit=5)
+        seen.extend(row['username'] for row in page['items'])
+        after = page['next_after']
+        pages += 1
+        if not page['has_more']:
+            break
+    assert seen == [f'voter{i:02d}' for i in range(23)]
+    assert pages == 5
+
+def test_last_full_page_has_no_more(app):
+    for i in range(4):
+        add_user(f'voter{i}')
+    db.session.commit()
+    page = list_voters(limit=4)
+    assert len(page['items']) == 4 and not page['has_more']
+    assert list_voters(after=page['next_after']) == {'items': [], 'next_after': page['next_after'],
+                                                     'has_more': False}
+
+def test_rows_are_projected(app):
+    add_user('voter')
+    db.session.commit()
+    row, = list_voters()['items']
+    assert set(row) == {'id', 'username', 'email', 'is_registered', 'has_retina_scan', 'created_at'}
+
+def test_voter_filters(app):
+    add_user('admin', is_admin=True)
+    add_user('alice')
+    add_user('albert', is_registered=False)
+    add_user('bob')
+    db.session.commit()
+
+    assert [row['username'] for row in list_voters()['items']] == ['alice', 'albert', 'bob']
+    assert [row['username'] for row in list_voters(q='al')['items']] == ['alice', 'albert']
+    assert [row['username'] for row in list_voters(q='bob@')['items']] == ['bob']
+    assert [row['username'] for row in list_voters(registered=False)['items']] == ['albert']
+
+def test_prefix_wildcards_are_literal(app):
+    db.session.add_all([Candidate(name=name, position='Mayor')
+                        for name in ('100% Party', '1000 Voices', 'a_b', 'axb')])
+    db.session.commit()
+    assert [row['name'] for row in list_candidates(q='100%')['items']] == ['100% Party']
+    assert [row['name'] for row in list_candidates(q='a_')['items']] == ['a_b']
+
+def test_has_retina_scan_counts_blob_and_inline_scans(app):
+    add_user('blob', retina_scan_digest='f' * 64)
+    add_user('inline', retina_scan=b'legacy scan')
+    add_user('none')
+    db.session.commit()
+    assert {row['username']: row['has_retina_scan'] for row in list_voters()['items']} == \
+        {'blob': True, 'inline': True, 'none': False}
+
+def test_keyset_page_with_filter(app):
+    db.session.add_all([Election(title=f'Election {i}', start_date=datetime(2024, 1, 1),
+                                     end_date=datetime(2024, 1, 2), is_active=i % 2 == 0) for i in range(6)])
+    db.session.commit()
+    page = keyset_page((Election.id, Election.title), Election.id, [Election.is_active == True], limit=2)
+    assert [row['title'] for row in page['items']] == ['Election 0', 'Election 2']
+    assert page['has_more']
+    page = keyset_page((Election.id, Election.title), Election.id, [Election.is_active == True],
+                       after=page['next_after'], limit=2)
+    assert [row['title'] for row in page['items']] == ['Election 4']
+    assert not page['has_more']
@@ -0,0 +1,77 @@
+import pytest
+
+from conftest import stage_votes
+from merkle import EMPTY_ROOT, leaf_hash, merkle_proof, merkle_root, verify_proof
+from mining import hash_block
+
+def make_votes(count):
+    return [{'user_id': i, 'candidate_id': i % 3, 'election_id': 1} for i in range(count)]
+
+def test_empty_root():
+    assert merkle_root([]) == EMPTY_ROOT
+
+def test_single_vote_root_is_its_leaf():
+    votes = make_votes(1)
+    assert merkle_root(votes) == leaf_hash(votes[0]).hex()
+    assert merkle_proof(votes, 0) == []
+
+@pytest.mark.parametrize('count', range(1, 10))
+def test_every_proof_verifies(count):
+    votes = make_votes(count)
+    root = merkle_root(votes)
+    for position, vote in enumerate(votes):
+        proof = merkle_proof(votes, position)
+        assert verify_proof(leaf_hash(vote).hex(), proof, root)
+        # Unpaired nodes are promoted, so no proof is longer than the tree is deep
+        assert len(proof) <= (count - 1).bit_length()
+
+def test_proof_rejects_another_vote():
+    votes = make_votes(5)
+    proof = merkle_proof(votes, 2)
+    assert not verify_proof(leaf_hash(votes[3]).hex(), proof, merkle_root(votes))
+    assert not verify_proof(leaf_hash({'user_id': 2, 'candidate_id': 0, 'election_id': 2}).hex(),
+                            proof, merkle_root(votes))
+
+def test_proof_rejects_tampered_step():
+    votes = make_votes(6)
+    proof = merkle_proof(votes, 4)
+    proof[0] = dict(proof[0], side='left' if proof[0]['side'] == 'right' else 'right')
+    assert not verify_proof(leaf_hash(votes[4]).hex(), proof, merkle_root(votes))
+
+def test_root_depends_on_vote_order():
+    votes = make_votes(4)
+    assert merkle_root(votes) != merkle_root(votes[::-1])
+
+def test_proof_position_out_of_range():
+    with pytest.raises(IndexError):
+        merkle_proof(make_votes(3), 3)
+
+def test_receipt_is_pending_until_sealed(blockchain):
+    receipt, = stage_votes(blockchain, 1)
+    status = blockchain.lookup_receipt(receipt)
+    assert status['status'] == 'pending'
+    assert status['block_index'] is None
+    assert blockchain.inclusion_proof(receipt) is None
+
+    block = blockchain.seal_pending()
+    status = blockchain.lookup_receipt(receipt)
+    assert status['status'] == 'sealed'
+    assert status['block_index'] == block['index']
+    assert status['block_hash'] == block['hash']
+
+def test_unknown_receipt(blockchain):
+    assert blockchain.lookup_receipt('0' * 32) is None
+    assert blockchain.inclusion_proof('0' * 32) is None
+
+def test_inclusion_proof_leads_to_block_hash(blockchain):
+    receipts = stage_votes(blockchain, 3)
+    block = blockchain.seal_pending(max_votes=3)
+
+    for receipt in receipts:
+        proof = blockchain.inclusion_proof(receipt)
+        header = proof['block']
+        assert proof['leaf_hash'] == leaf_hash(proof['vote']).hex()
+        assert verify_proof(proof['leaf_hash'], proof['proof'], header['merkle_root'])
+        # The header alone re-hashes to the block hash, without the other votes
+        assert 'data' not in header
+        assert hash_block(header) == header['hash'] == block['hash']
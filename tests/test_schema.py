@@ -0,0 +1,103 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from app import db
+from blockchain import Blockchain
+from conftest import TEST_DIFFICULTY
+from models import User
+from schema import create_tables, upgrade_schema
+
+# Tables as the first release created them, before any column or index was added
+BASELINE_SCHEMA = (
+    """CREATE TABLE user (
+        id INTEGER NOT NULL, username VARCHAR(64) NOT NULL, email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(256), is_admin BOOLEAN, is_registered BOOLEAN, retina_scan BLOB,
+        retina_features BLOB, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (username), UNIQUE (email))""",
+    """CREATE TABLE candidate (
+        id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, description TEXT,
+        position VARCHAR(100) NOT NULL, created_at DATETIME, PRIMARY KEY (id))""",
+    """CREATE TABLE election (
+        id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, description TEXT,
+        start_date DATETIME NOT NULL, end_date DATETIME NOT NULL, is_active BOOLEAN,
+        created_at DATETIME, PRIMARY KEY (id))""",
+    """CREATE TABLE block (
+        id INTEGER NOT NULL, timestamp DATETIME, previous_hash VARCHAR(256),
+        hash VARCHAR(256) NOT NULL, nonce INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (id))""",
+    """CREATE TABLE vote (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, candidate_id INTEGER NOT NULL,
+        election_id INTEGER NOT NULL, timestamp DATETIME, blockchain_hash VARCHAR(256),
+        PRIMARY KEY (id))""",
+)
+
+EXPECTED_UPGRADES = {'user.retina_scan_digest', 'block.merkle_root', 'block.difficulty',
+                     'vote.receipt', 'ix_vote_receipt', 'ix_vote_election_candidate', 'ix_user_registered_admin',
+                     'ix_vote_timestamp'}
+
+def create_baseline_database():
+    db.drop_all()
+    with db.engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, username, email, is_admin, is_registered, retina_scan) "
+                          "VALUES (1, 'voter', 'voter@example.com', 0, 1, x'00ff')"))
+        conn.execute(text("INSERT INTO block (id, timestamp, previous_hash, hash, nonce, data) "
+                          "VALUES (1, :timestamp, '1', :hash, 100, '[]')"),
+                     {'timestamp': datetime(2024, 1, 1, 12), 'hash': 'ab' * 32})
+
+def test_upgrade_baseline_database(app):
+    create_baseline_database()
+    create_tables()
+    added = set(upgrade_schema())
+
+    assert EXPECTED_UPGRADES <= added
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        assert {c.name for c in table.columns} == {c['name'] for c in inspector.get_columns(table.name)}
+        assert {i.name for i in table.indexes} <= {i['name'] for i in inspector.get_indexes(table.name)}
+    # A second run has nothing left to do
+    assert upgrade_schema() == []
+
+def test_upgrade_keeps_existing_rows(app):
+    create_baseline_database()
+    create_tables()
+    upgrade_schema()
+
+    user = db.session.get(User, 1)
+    assert user.username == 'voter'
+    assert user.retina_scan == b'\x00\xff'
+    assert user.retina_scan_digest is None
+
+    # The pre-Merkle genesis block is kept and trusted as it is
+    chain = Blockchain(difficulty=TEST_DIFFICULTY)
+    chain.initialize()
+    assert chain.last_block['hash'] == 'ab' * 32
+    assert 'merkle_root' not in chain.last_block
+    assert chain.is_valid_chain(full=True)
+
+def test_concurrent_upgrades(app):
+    create_baseline_database()
+    results, errors = [], []
+
+    def worker():
+        try:
+            with app.app_context():
+                create_tables()
+                results.append(upgrade_schema())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    added = [name for result in results for name in result]
+    # Every change is made exactly once, by whichever worker got there first
+    assert len(added) == len(set(added))
+    assert EXPECTED_UPGRADES <= set(added)
+    assert upgrade_schema() == []
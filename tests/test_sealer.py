@@ -0,0 +1,73 @@
+import time
+
+from app import db
+from conftest import stage_votes
+from models import ChainState
+from sealer import BlockSealer
+
+def make_sealer(blockchain, name, **kwargs):
+    sealer = BlockSealer(blockchain, **kwargs)
+    # Distinct ids stand in for sealers in different worker processes
+    sealer.sealer_id = name
+    return sealer
+
+def test_only_one_sealer_holds_the_lease(blockchain):
+    first = make_sealer(blockchain, 'first')
+    second = make_sealer(blockchain, 'second')
+
+    assert first.acquire_lease()
+    assert not second.acquire_lease()
+    # The holder renews its own lease
+    assert first.acquire_lease()
+    assert db.session.get(ChainState, 1).sealer_id == 'first'
+
+def test_lapsed_lease_is_taken_over(blockchain):
+    first = make_sealer(blockchain, 'first', lease_seconds=0.1)
+    second = make_sealer(blockchain, 'second', lease_seconds=0.1)
+
+    assert first.acquire_lease()
+    time.sleep(0.2)
+    assert second.acquire_lease()
+    assert not first.acquire_lease()
+    assert not first.leader and second.leader
+
+def test_released_lease_is_free_at_once(blockchain):
+    first = make_sealer(blockchain, 'first')
+    second = make_sealer(blockchain, 'second')
+
+    assert first.acquire_lease()
+    first.release_lease()
+    assert second.acquire_lease()
+    # Releasing a lease held by someone else changes nothing
+    first.release_lease()
+    assert db.session.get(ChainState, 1).sealer_id == 'second'
+
+def test_run_once_waits_for_a_full_block(blockchain):
+    sealer = make_sealer(blockchain, 'only', block_size=3, max_wait=60)
+    stage_votes(blockchain, 2)
+    assert sealer.run_once() is None
+    assert len(sealer.run_once(force=True)['data']) == 2
+
+def test_run_forever_seals_only_while_leader(app, blockchain):
+    other = make_sealer(blockchain, 'other')
+    assert other.acquire_lease()
+    stage_votes(blockchain, 2)
+
+    sealer = make_sealer(blockchain, 'worker', poll_interval=0.05)
+    sealer.start(app)
+    time.sleep(0.3)
+    db.session.rollback()
+    assert db.session.get(ChainState, 1).height == 1
+
+    other.release_lease()
+    deadline = time.monotonic() + 5
+    while db.session.get(ChainState, 1).height == 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+        db.session.rollback()
+    sealer.stop()
+
+    db.session.rollback()
+    state = db.session.get(ChainState, 1)
+    assert state.height == 2
+    # Stopping gives the lease up
+    assert state.sealer_id is None
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from app import db
+from models import PendingVote, Vote, VoteTally
+from vote_writer import VoteRejected, VoteWriter, _Submission
+
+class CountingSealer:
+    """Stands in for BlockSealer; records how often it was woken"""
+
+    def __init__(self):
+        self.notified = 0
+
+    def notify(self):
+        self.notified += 1
+
+def vote(user_id, candidate_id=1, election_id=1):
+    return {'user_id': user_id, 'candidate_id': candidate_id, 'election_id': election_id}
+
+def tally(election_id=1):
+    return {row.candidate_id: row.votes for row in VoteTally.query.filter_by(election_id=election_id)}
+
+def test_new_vote_is_staged_in_the_callers_transaction(blockchain):
+    receipt = blockchain.new_vote(vote(1))
+    db.session.rollback()
+    assert blockchain.lookup_receipt(receipt) is None
+
+    receipt = blockchain.new_vote(vote(1))
+    db.session.commit()
+    assert blockchain.lookup_receipt(receipt)['status'] == 'pending'
+    # Proof of work waits for the sealer
+    assert len(blockchain.chain) == 1
+
+def test_submit_records_vote_queue_entry_and_tally(blockchain):
+    sealer = CountingSealer()
+    writer = VoteWriter(blockchain, sealer)
+    receipt = writer.submit(vote(1, candidate_id=2))
+
+    assert Vote.query.filter_by(receipt=receipt).one().candidate_id == 2
+    assert PendingVote.query.filter_by(receipt=receipt).one().status == 'pending'
+    assert tally() == {2: 1}
+    assert sealer.notified == 1
+
+    block = blockchain.seal_pending()
+    assert Vote.query.filter_by(receipt=receipt).one().blockchain_hash == block['hash']
+
+def test_second_vote_is_rejected(blockchain):
+    writer = VoteWriter(blockchain)
+    writer.submit(vote(1))
+    with pytest.raises(VoteRejected):
+        writer.submit(vote(1, candidate_id=2))
+    assert Vote.query.count() == 1
+    assert tally() == {1: 1}
+
+def test_batch_rejects_duplicates_within_it(blockchain):
+    writer = VoteWriter(blockchain)
+    batch = [_Submission(vote(1)), _Submission(vote(1, candidate_id=2)),
+             _Submission(vote(2))]
+    writer.commit_batch(batch)
+
+    assert [s.receipt is not None for s in batch] == [True, False, True]
+    assert isinstance(batch[1].error, VoteRejected)
+    assert Vote.query.count() == 2
+    assert PendingVote.query.count() == 2
+
+def test_failed_batch_is_retried_one_vote_at_a_time(blockchain, monkeypatch):
+    new_vote = blockchain.new_vote
+
+    def failing_new_vote(data):
+        if data['user_id'] == 2:
+            raise ValueError('bad vote')
+        return new_vote(data)
+
+    monkeypatch.setattr(blockchain, 'new_vote', failing_new_vote)
+    writer = VoteWriter(blockchain)
+    batch = [_Submission(vote(user_id)) for user_id in (1, 2, 3)]
+    writer.commit_batch(batch)
+
+    assert [s.receipt is not None for s in batch] == [True, False, True]
+    assert isinstance(batch[1].error, ValueError)
+    assert all(s.done.is_set() for s in batch)
+    assert sorted(v.user_id for v in Vote.query.all()) == [1, 3]
+    assert PendingVote.query.count() == 2
+    assert tally() == {1: 2}
+
+def test_concurrent_votes_share_commits(app, blockchain):
+    sealer = CountingSealer()
+    writer = VoteWriter(blockchain, sealer, max_batch=64, max_wait=0.2)
+    commits = []
+    writer.listeners.append(commits.append)
+    writer.start(app)
+    try:
+        receipts = {}
+        threads = [threading.Thread(target=lambda u=user_id: receipts.__setitem__(u, writer.submit(vote(u))))
+                   for user_id in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        writer.stop()
+
+    db.session.rollback()
+    assert len(set(receipts.values())) == 8
+    assert Vote.query.count() == 8
+    assert sum(len(accepted) for accepted in commits) == 8
+    assert len(commits) < 8
+    assert sealer.notified == len(commits)